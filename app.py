@@ -1,141 +1,182 @@
-from flask import Flask, request
-import psycopg2
+import hmac
+import logging
 import os
+from functools import wraps
+
+from flask import Flask, request, jsonify
 from twilio.twiml.messaging_response import MessagingResponse
-from ia_construccion import es_consulta_construccion, responder_consulta_construccion
+from ia_construccion import es_consulta_construccion
+from calculadora_construccion import (
+    calcular_materiales, codificar_sugeridos, decodificar_sugeridos, formatear_calculo, productos_para_calculo,
+)
+from db import en_transaccion
+from datos import Turno
+from conversacion import MaquinaEstados, Respuesta
+from catalogo import POR_PAGINA, actualizar_producto, buscar_productos, buscar_producto_por_id
+from carrito import resumen_carrito
+from tiempos import medido
+import cache
+import db
+import arranque
+import recibidos
+import sesiones
+import tiempos
 
 app = Flask(__name__)
+log = logging.getLogger(__name__)
 
-def conectar_db():
-    return psycopg2.connect(
-        host=os.getenv("DB_HOST"),
-        database=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASS"),
-    )
+# Con el modo asíncrono el webhook solo encola y responde vacío; las respuestas salen por la API de
+# Twilio. Necesita el broker de celery (CELERY_BROKER_URL) y sus workers, por eso viene apagado.
+WHATSAPP_ASINCRONO = os.getenv("WHATSAPP_ASINCRONO", "0") == "1"
+# MessageSid ya atendidos, compartido entre workers (ver recibidos.py). No se conecta a nada al importar.
+mensajes_recibidos = recibidos.crear_registro()
+# Token para las rutas de administración y de métricas (Authorization: Bearer <token>); sin él
+# quedan deshabilitadas
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def requiere_admin(vista):
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        enviado = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if not ADMIN_TOKEN or not hmac.compare_digest(enviado.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({"error": "no autorizado"}), 403
+        return vista(*args, **kwargs)
+    return envoltura
+
+@medido("catalogo.mostrar_productos")
+def mostrar_productos(turno, respuesta, termino, pagina):
+    productos, total = buscar_productos(termino, pagina)
+    if not productos:
+        if pagina > 1:
+            respuesta.message("🔚 No hay más resultados. ✏️ *Escribe el ID del producto que quieres agregar:*")
+        else:
+            respuesta.message("❌ No encontré productos con ese nombre. Intenta con otro 🔄.")
+        return
+    texto = f"🔍 *Productos encontrados ({total}):*\n\n"
+    for p in productos:
+        texto += (
+            f"🛠️ *ID:       * `{p[0]}`\n"
+            f"📦 *Producto: * *{p[1]}*\n"
+            f"💲 *Precio:   * ${int(p[2]):,}\n"
+            f"📦 *Stock disponible:* {p[3]}\n"
+            "──────────────────────\n"
+        )
+    if pagina * POR_PAGINA < total:
+        texto += "➡️ Escribe *mas* para ver más resultados.\n"
+    texto += "✏️ *Escribe el ID del producto que quieres agregar:*"
+    turno.cambiar_estado(estado="esperando_id_producto", dato_temp=f"{pagina}|{termino}")
+    respuesta.message(texto.replace(",", "."))
+
+@app.route("/metricas")
+@requiere_admin
+def metricas():
+    return jsonify({
+        "tiempos": tiempos.metricas(),
+        "db": db.metricas(),
+        "cache": cache.metricas(),
+        "sesiones": sesiones.almacen.metricas(),
+        "arranque": arranque.metricas(),
+    })
+
+@app.route("/metricas/tiempos")
+@requiere_admin
+def metricas_tiempos():
+    return jsonify(tiempos.metricas())
+
+@app.route("/metricas/perfilador")
+@requiere_admin
+def metricas_perfilador():
+    return jsonify(tiempos.perfilador.metricas())
+
+@app.route("/metricas/db")
+@requiere_admin
+def metricas_db():
+    return jsonify(db.metricas())
+
+@app.route("/metricas/cache")
+@requiere_admin
+def metricas_cache():
+    return jsonify(cache.metricas())
+
+@app.route("/metricas/sesiones")
+@requiere_admin
+def metricas_sesiones():
+    return jsonify(sesiones.almacen.metricas())
+
+@app.route("/metricas/arranque")
+@requiere_admin
+def metricas_arranque():
+    return jsonify(arranque.metricas())
+
+@app.route("/admin/perfilador", methods=["POST"])
+@requiere_admin
+def admin_perfilador():
+    # Enciende o apaga el perfilador sin reiniciar. Como las métricas, vale solo para el worker
+    # que atiende la petición (ver "pid" en la respuesta); PERFILADOR=1 lo enciende en todos.
+    datos = request.get_json(silent=True) or request.form
+    try:
+        if datos.get("lento_ms") is not None:
+            tiempos.perfilador.lento_ms = float(datos["lento_ms"])
+    except (TypeError, ValueError):
+        return jsonify({"error": "lento_ms debe ser un número"}), 400
+    if datos.get("activo") is not None:
+        tiempos.perfilador.activo = str(datos["activo"]).lower() in ("1", "true", "si", "sí")
+    return jsonify({"pid": os.getpid(), "activo": tiempos.perfilador.activo,
+                    "lento_ms": tiempos.perfilador.lento_ms})
+
+@app.route("/admin/productos/<int:id_producto>", methods=["POST"])
+@requiere_admin
+def admin_actualizar_producto(id_producto):
+    datos = request.get_json(silent=True) or request.form
+    try:
+        precio = int(datos["precio"]) if datos.get("precio") is not None else None
+        stock = int(datos["stock"]) if datos.get("stock") is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "precio y stock deben ser enteros"}), 400
+    if not actualizar_producto(id_producto, nombre=datos.get("nombre"), medida=datos.get("medida"),
+                               precio=precio, stock=stock):
+        return jsonify({"error": "producto no encontrado"}), 404
+    return jsonify({"id_producto": id_producto})
 
-def es_consulta_construccion(mensaje):
-    mensaje = mensaje.lower()
-    palabras_clave = [
-        "radier", "cemento", "arena", "ripio", "hacer mezcla",
-        "cuánto necesito", "cuantos sacos", "materiales", "hormigón",
-        "cuanto cemento", "cuanto material", "mezcla radier"
-    ]
-    return any(p in mensaje for p in palabras_clave)
-
-
-def obtener_cliente_por_telefono(telefono):
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id_cliente, nombre FROM clientes WHERE telefono = %s", (telefono,))
-    cliente = cursor.fetchone()
-    conn.close()
-    return cliente
-def crear_cliente(nombre, telefono):
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO clientes (nombre, telefono) VALUES (%s, %s) RETURNING id_cliente", (nombre, telefono))
-    id_cliente = cursor.fetchone()[0]
-    conn.commit()
-    conn.close()
-    return id_cliente
-
-def crear_carrito(id_cliente):
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO carritos (id_cliente, estado) VALUES (%s, 'activo') RETURNING id_carrito", (id_cliente,))
-    id_carrito = cursor.fetchone()[0]
-    conn.commit()
-    conn.close()
-    return id_carrito
-
-def crear_sesion(id_cliente, estado='inicio', dato_temp=None):
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO sesiones (id_cliente, estado, dato_temp) VALUES (%s, %s, %s) RETURNING id_sesion",
-        (id_cliente, estado, dato_temp)
-    )
-    id_sesion = cursor.fetchone()[0]
-    conn.commit()
-    conn.close()
-    return id_sesion
-
-def actualizar_sesion(id_cliente, estado, dato_temp=None):
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE sesiones SET estado = %s, dato_temp = %s WHERE id_cliente = %s AND estado != 'finalizado'",
-        (estado, dato_temp, id_cliente)
-    )
-    conn.commit()
-    conn.close()
-
-def obtener_sesion(id_cliente):
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id_sesion, estado, dato_temp FROM sesiones WHERE id_cliente = %s AND estado != 'finalizado'", (id_cliente,))
-    sesion = cursor.fetchone()
-    conn.close()
-    return sesion
-
-def finalizar_sesion(id_cliente):
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE sesiones SET estado = 'finalizado' WHERE id_cliente = %s", (id_cliente,))
-    conn.commit()
-    conn.close()
-
-def buscar_productos(nombre_producto):
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id_producto, nombre, precio, stock, medida FROM productos WHERE LOWER(nombre) LIKE %s", (f"%{nombre_producto.lower()}%",))
-    productos = cursor.fetchall()
-    conn.close()
-    return productos
-
-def buscar_producto_por_id(id_producto):
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT nombre, medida FROM productos WHERE id_producto = %s",
-        (id_producto,)
-    )
-    producto = cursor.fetchone()
-    conn.close()
-    return producto
-
-def agregar_producto_a_carrito(id_carrito, id_producto, cantidad):
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO carrito_items (id_carrito, id_producto, cantidad) VALUES (%s, %s, %s)",
-        (id_carrito, id_producto, cantidad)
-    )
-    conn.commit()
-    conn.close()
-
-def ver_carrito(id_carrito):
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute(""" 
-        SELECT p.nombre, p.precio, c.cantidad
-        FROM carrito_items c
-        JOIN productos p ON p.id_producto = c.id_producto
-        WHERE c.id_carrito = %s
-    """, (id_carrito,))
-    items = cursor.fetchall()
-    conn.close()
-    return items
 @app.route("/whatsapp", methods=["POST"])
 def whatsapp():
     telefono = request.form['From'].split(":")[-1]
     mensaje = request.form['Body'].strip()
+    sid = request.form.get('MessageSid')
+
     respuesta = MessagingResponse()
+    with tiempos.peticion("webhook"):
+        if WHATSAPP_ASINCRONO:
+            # celery se importa con el primer mensaje, o antes si gunicorn precarga la app.
+            # Los reintentos de Twilio se descartan al procesarlos en la cola.
+            from tareas import encolar_mensaje
+            encolar_mensaje(telefono, mensaje, sid)
+        else:
+            for texto in procesar_mensaje(telefono, mensaje, sid):
+                respuesta.message(texto)
+    return str(respuesta)
+
+@en_transaccion
+def procesar_mensaje(telefono, mensaje, sid=None):
+    # Reintento de Twilio de un mensaje ya atendido. Con la tabla, si el original sigue en curso
+    # en otro worker el INSERT espera a que termine.
+    if sid and not mensajes_recibidos.agregar(sid):
+        return []
+    try:
+        respuesta = Respuesta()
+        turno = Turno.cargar(telefono)
+        atender_mensaje(turno, mensaje, respuesta)
+        turno.guardar()
+    except Exception:
+        # Que el reintento de Twilio sí se procese
+        if sid:
+            mensajes_recibidos.quitar(sid)
+        raise
+    return respuesta.mensajes
 
-    cliente = obtener_cliente_por_telefono(telefono)
-    
-    if not cliente:
+def atender_mensaje(turno, mensaje, respuesta):
+    if not turno.existe_cliente:
+        tiempos.marcar_estado("nuevo_cliente")
         if mensaje.lower() in ["hola", "buenas", "iniciar"]:
             respuesta.message(
                 "✅ ¡Bienvenido a 🟦 *CENTRAL* 🟨 *GRIFERIAS*! 👷‍♂️🔧\n\n"
@@ -147,21 +188,18 @@ def whatsapp():
                 "──────────────────────────\n"
                 "✨ *Responde con el número de la opción que prefieras!*"
                 )
-            return str(respuesta)
+            return
         else:
-            id_cliente = crear_cliente(mensaje, telefono)
-            id_sesion = crear_sesion(id_cliente, estado="menu")
-            id_carrito = crear_carrito(id_cliente)
+            turno.crear_cliente(mensaje, estado="menu")
             respuesta.message(f"✅ ¡Hola {mensaje}! Tu cuenta ha sido creada.\n\nEscribe un número para elegir:\n1️⃣ Buscar productos\n2️⃣ Ver carrito\n3️⃣ Finalizar compra")
-            return str(respuesta)
+            return
 
-    id_cliente, nombre = cliente
-    sesion = obtener_sesion(id_cliente)
+    nombre = turno.nombre
 
     # Si no hay sesión activa, la creamos y mostramos el menú
-    if not sesion:
-        crear_sesion(id_cliente, estado="menu")
-        id_carrito = crear_carrito(id_cliente)
+    if not turno.tiene_sesion:
+        tiempos.marcar_estado("sin_sesion")
+        turno.iniciar_sesion(estado="menu")
         respuesta.message(
             f"👋 ¡Hola *{nombre}*! Qué bueno tenerte de vuelta en 🛠️🟦 *CENTRAL* 🟨 *GRIFERIAS*! 👷‍♂️🔧\n\n"
             "💬 Soy tu Vendedor Virtual 24/7, siempre listo para ayudarte. ✨\n\n"
@@ -173,114 +211,113 @@ def whatsapp():
             "──────────────────────────\n"
             "✨ *Responde con el número de la opción que prefieras!*"
         )
-        return str(respuesta)
-    id_sesion, estado, dato_temp = sesion
-
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id_carrito FROM carritos WHERE id_cliente = %s AND estado = 'activo' ORDER BY id_carrito DESC LIMIT 1", (id_cliente,))
-    carrito = cursor.fetchone()
-    conn.close()
-    id_carrito = carrito[0] if carrito else crear_carrito(id_cliente)
-
-    if estado == "menu":
-
-        if es_consulta_construccion(mensaje):
-           ## from ia_construccion import responder_consulta_construccion
-            resultado = responder_consulta_construccion(mensaje)
-            actualizar_sesion(id_cliente, estado="menu")
-            respuesta.message(
-                f"📐 Aquí tienes una recomendación:\n\n{resultado}\n\n"
-                "¿Deseas agregar alguno de estos productos al carrito? 🛒"
-            )
-            return str(respuesta)
-
-
-        if mensaje == "1":
-            actualizar_sesion(id_cliente, estado="buscando_producto")
-            respuesta.message("🔍 Escribe el nombre del producto que quieres buscar:")
-        elif mensaje == "2":
-            items = ver_carrito(id_carrito)
-            if not items:
-                respuesta.message("🛒 Tu carrito está vacío. ¡Agrega productos para comenzar! 🔨")
-            else:
-                texto = "🛒 *Tu carrito contiene:*\n\n"
-                texto += "📦 *Producto*         |  🔢 *Cant.*  |  💲 *Subtotal*\n"
-                texto += "────────────────────────────────────────\n"
-
-                total = 0
-                for nombre, precio, cantidad in items:
-                    subtotal = precio * cantidad
-                    total += subtotal
-                    # Formateo bonito
-                    texto += f"🔹 {nombre.ljust(15)[:15]} | {str(cantidad).rjust(5)}     | ${subtotal:,.0f}\n"
-
-                texto += "────────────────────────────────────────\n"
-                texto += f"💰 *Total:* ${total:,.0f}"
-
-                # Para que en WhatsApp se vea el punto como separador de miles
-                respuesta.message(texto.replace(",", "."))
-            
-            actualizar_sesion(id_cliente, estado="menu")
-        elif mensaje == "3":
-            finalizar_sesion(id_cliente)
-            respuesta.message("✅ ¡Gracias por tu compra! 🛠️")
-
-
-      
-        else:
-            respuesta.message("❌ Opción inválida. Por favor elige 1, 2 o 3.")
-    
-    elif estado == "buscando_producto":
-        productos = buscar_productos(mensaje)
-        if not productos:
-            respuesta.message("❌ No encontré productos con ese nombre. Intenta con otro 🔄.")
-        else:
-            texto = "🔍 *Productos encontrados:*\n\n"
-            for p in productos:
-                texto += (
-                    f"🛠️ *ID:       * `{p[0]}`\n"
-                    f"📦 *Producto: * *{p[1]}*\n"
-                    f"💲 *Precio:   * ${int(p[2]):,}\n"
-                    f"📦 *Stock disponible:* {p[3]}\n"
-                    "──────────────────────\n"
-                )
-            texto += "✏️ *Escribe el ID del producto que quieres agregar:*"
-            actualizar_sesion(id_cliente, estado="esperando_id_producto", dato_temp=mensaje)
-            respuesta.message(texto.replace(",", "."))
-    
-    elif estado == "esperando_id_producto":
-        try:
-            id_producto = int(mensaje)
-            producto = buscar_producto_por_id(id_producto)
-            if not producto:
-                respuesta.message("❌ Producto no encontrado. Intenta de nuevo.")
-                return str(respuesta) 
-            
-            nombre_producto, medida = producto
-            actualizar_sesion(id_cliente, estado="esperando_cantidad", dato_temp=str(id_producto))
-            respuesta.message(f"📦 ¿Cuántos *{medida}* de *{nombre_producto}* quieres agregar?")
-            return str(respuesta)  
-
-        except:
-            respuesta.message("❌ ID inválido. Intenta de nuevo.")
-            return str(respuesta)  
-
-
-    elif estado == "esperando_cantidad":
+        return
+    turno.asegurar_carrito()
+    conversacion.atender(turno, mensaje, respuesta)
+
+conversacion = MaquinaEstados(inicial="menu")
+
+@conversacion.estado("menu", transiciones=["buscando_producto", "confirmando_materiales", "finalizado"])
+def estado_menu(turno, mensaje, respuesta):
+    if es_consulta_construccion(mensaje):
+        calculo = calcular_materiales(mensaje)
+        if calculo:
+            sugeridos = productos_para_calculo(calculo)
+            if sugeridos:
+                turno.cambiar_estado(estado="confirmando_materiales", dato_temp=codificar_sugeridos(sugeridos))
+            respuesta.message(formatear_calculo(calculo, sugeridos).replace(",", "."))
+            return
+
+        # Sin medidas que calcular: la generación corre en el worker de IA y la respuesta llega por la API de Twilio
+        from tareas import responder_construccion
         try:
-            cantidad = int(mensaje)
-            id_producto = int(dato_temp)
-            agregar_producto_a_carrito(id_carrito, id_producto, cantidad)
-            actualizar_sesion(id_cliente, estado="menu")
+            # Sin reintentos: si no hay broker el webhook no se queda esperando la conexión
+            responder_construccion.apply_async((turno.telefono, mensaje), retry=False)
+        except Exception:
+            log.exception("No se pudo encolar la consulta de construcción")
             respuesta.message(
-                f"🛒 ¡Listo! Agregué *{cantidad}* unidad(es) del producto al carrito."
-                "\n\nElige una opción:\n1️⃣ Buscar productos\n2️⃣ Ver carrito\n3️⃣ Finalizar compra"
+                "🧮 Ahora no puedo responder esa consulta. Indícame las medidas, por ejemplo "
+                "*radier de 5x4 m y 10 cm de espesor*, y te calculo los materiales."
             )
-        except:
-            respuesta.message("❌ Cantidad inválida. Intenta de nuevo.")
-        
-    return str(respuesta)
+            return
+        respuesta.message("🧮 Calculando los materiales… te respondo en un momento.")
+        return
+
+    if mensaje == "1":
+        turno.cambiar_estado(estado="buscando_producto")
+        respuesta.message("🔍 Escribe el nombre del producto que quieres buscar:")
+    elif mensaje == "2":
+        mensajes = resumen_carrito(turno.id_carrito) if turno.id_carrito else []
+        if not mensajes:
+            respuesta.message("🛒 Tu carrito está vacío. ¡Agrega productos para comenzar! 🔨")
+        # Los carritos largos van en varios mensajes
+        for texto in mensajes:
+            respuesta.message(texto)
+    elif mensaje == "3":
+        turno.finalizar()
+        respuesta.message("✅ ¡Gracias por tu compra! 🛠️")
+    else:
+        respuesta.message("❌ Opción inválida. Por favor elige 1, 2 o 3.")
+
+@conversacion.estado("buscando_producto", transiciones=["esperando_id_producto"])
+def estado_buscando_producto(turno, mensaje, respuesta):
+    mostrar_productos(turno, respuesta, mensaje, pagina=1)
+
+@conversacion.estado("esperando_id_producto", transiciones=["esperando_cantidad"])
+def estado_esperando_id_producto(turno, mensaje, respuesta):
+    if mensaje.lower() in ["mas", "más"]:
+        dato = turno.dato_temp or ""
+        pagina, _, termino = dato.partition("|")
+        try:
+            pagina = int(pagina)
+        except ValueError:
+            # Sesiones de antes de la paginación guardaban solo el término
+            pagina, termino = 0, dato
+        mostrar_productos(turno, respuesta, termino, pagina=pagina + 1)
+        return
+    try:
+        id_producto = int(mensaje)
+    except ValueError:
+        respuesta.message("❌ ID inválido. Intenta de nuevo.")
+        return
+
+    producto = buscar_producto_por_id(id_producto)
+    if not producto:
+        respuesta.message("❌ Producto no encontrado. Intenta de nuevo.")
+        return
+
+    nombre_producto, medida = producto
+    turno.cambiar_estado(estado="esperando_cantidad", dato_temp=str(id_producto))
+    respuesta.message(f"📦 ¿Cuántos *{medida}* de *{nombre_producto}* quieres agregar?")
+
+@conversacion.estado("esperando_cantidad", transiciones=["menu"])
+def estado_esperando_cantidad(turno, mensaje, respuesta):
+    try:
+        cantidad = int(mensaje)
+        id_producto = int(turno.dato_temp)
+    except (TypeError, ValueError):
+        respuesta.message("❌ Cantidad inválida. Intenta de nuevo.")
+        return
+
+    turno.agregar_item(id_producto, cantidad)
+    turno.cambiar_estado(estado="menu")
+    respuesta.message(
+        f"🛒 ¡Listo! Agregué *{cantidad}* unidad(es) del producto al carrito."
+        "\n\nElige una opción:\n1️⃣ Buscar productos\n2️⃣ Ver carrito\n3️⃣ Finalizar compra"
+    )
+
+@conversacion.estado("confirmando_materiales", transiciones=["menu"])
+def estado_confirmando_materiales(turno, mensaje, respuesta):
+    if mensaje.lower() in ["si", "sí", "s", "ok", "dale"]:
+        for id_producto, cantidad in decodificar_sugeridos(turno.dato_temp):
+            turno.agregar_item(id_producto, cantidad)
+        respuesta.message(
+            "🛒 ¡Listo! Agregué los materiales al carrito."
+            "\n\nElige una opción:\n1️⃣ Buscar productos\n2️⃣ Ver carrito\n3️⃣ Finalizar compra"
+        )
+    else:
+        respuesta.message("👌 No agregué nada.\n\nElige una opción:\n1️⃣ Buscar productos\n2️⃣ Ver carrito\n3️⃣ Finalizar compra")
+    turno.cambiar_estado(estado="menu")
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,89 @@
+import gc
+import importlib
+import os
+import time
+
+# Con GUNICORN_PRELOAD=1 el master importa la app y arma el índice de productos antes del fork.
+# Los workers comparten esas páginas por copy-on-write mientras no las escriban; el índice
+# vuelve a ser privado de cada worker después de su primera recarga completa (BUSCADOR_RECARGA).
+GUNICORN_PRELOAD = os.getenv("GUNICORN_PRELOAD") == "1"
+
+# Importaciones pesadas que la app hace recién en el primer uso; la precarga las adelanta
+DIFERIDOS = ["psycopg2.extras", "tareas", "twilio.rest"]
+
+# gunicorn.conf.py importa este módulo antes que la app: desde aquí se mide el arranque
+INICIO = time.perf_counter()
+_datos = {}
+
+
+def memoria():
+    # MB del proceso actual. PSS reparte las páginas compartidas entre los procesos que las usan,
+    # así que es la cifra que mide cuánto cuesta de verdad cada worker.
+    campos = {"Rss": "rss_mb", "Pss": "pss_mb", "Shared_Clean": "compartida_mb", "Shared_Dirty": "compartida_mb",
+              "Private_Clean": "privada_mb", "Private_Dirty": "privada_mb"}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            valores = dict.fromkeys(campos.values(), 0.0)
+            for linea in f:
+                nombre, _, resto = linea.partition(":")
+                if nombre in campos:
+                    valores[campos[nombre]] += int(resto.split()[0]) / 1024
+            return {k: round(v, 1) for k, v in valores.items()}
+    except OSError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            _, residente, compartida = (int(x) for x in f.read().split()[:3])
+        pagina = os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+        return {"rss_mb": round(residente * pagina, 1), "compartida_mb": round(compartida * pagina, 1)}
+    except (OSError, ValueError):
+        return {}
+
+
+def precargar():
+    # Se llama en el master de gunicorn, con la app ya importada y antes de crear los workers
+    import buscador
+    import calculadora_construccion  # noqa: F401 (tablas de dosificación)
+    import db
+
+    _datos["importacion_s"] = round(time.perf_counter() - INICIO, 3)
+    inicio = time.perf_counter()
+    for nombre in DIFERIDOS:
+        importlib.import_module(nombre)
+    db.importar_psycopg2()
+    buscador.obtener_indice()
+    # Los sockets del master no deben heredarse: cada worker abre su propio pool
+    db.cerrar_pool()
+    # Lo que existe hasta aquí queda fuera del recolector: si no, cada pasada del GC en un
+    # worker escribe en los encabezados de esos objetos y rompe el copy-on-write
+    gc.collect()
+    gc.freeze()
+    _datos["precarga_s"] = round(time.perf_counter() - inicio, 3)
+    _datos["productos_indexados"] = len(buscador.indice)
+    _datos["master"] = memoria()
+
+
+def marcar_fork():
+    _datos["fork"] = time.perf_counter()
+
+
+def worker_listo():
+    # Sin precarga incluye la importación de la app dentro del worker
+    if "fork" in _datos:
+        _datos["worker_listo_s"] = round(time.perf_counter() - _datos.pop("fork"), 3)
+    _datos["worker"] = memoria()
+
+
+def resumen():
+    partes = [f"pid {os.getpid()}"]
+    for clave, nombre in [("importacion_s", "importación"), ("precarga_s", "precarga"), ("worker_listo_s", "app lista")]:
+        if clave in _datos:
+            partes.append(f"{nombre} {_datos[clave]:.2f}s")
+    mem = _datos.get("worker") or _datos.get("master") or {}
+    if mem:
+        partes.append(", ".join(f"{k[:-3].upper()} {v:.0f} MB" for k, v in mem.items()))
+    return " | ".join(partes)
+
+
+def metricas():
+    return {"pid": os.getpid(), "precarga": GUNICORN_PRELOAD, **_datos, "ahora": memoria()}
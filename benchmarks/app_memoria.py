@@ -0,0 +1,12 @@
+# La app conectada a la base en memoria, para levantarla con gunicorn sin Postgres.
+# Cada worker tiene su propia base, así que debe correr con un solo worker:
+#   gunicorn -c gunicorn.conf.py --pythonpath .,benchmarks -w 1 app_memoria:app
+import os
+
+os.environ.setdefault("WHATSAPP_ASINCRONO", "0")
+
+from memoria_bd import instalar
+
+base = instalar(n_productos=int(os.getenv("CARGA_PRODUCTOS", "5000")))
+
+from app import app  # noqa: E402
@@ -0,0 +1,111 @@
+# Tiempo de importación de la app y memoria de los workers de gunicorn, con y sin precarga.
+#
+#   python benchmarks/arranque.py                  # solo importación: tiempo, RSS y módulos más lentos
+#   python benchmarks/arranque.py --gunicorn -w 4  # además levanta gunicorn con GUNICORN_PRELOAD=0 y 1
+#
+# La precarga con --gunicorn arma el índice de productos en el master, así que necesita la base
+# (DB_HOST, DB_NAME, DB_USER, DB_PASS).
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+RE_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+HIJO = "import time, arranque; inicio = time.perf_counter(); import app; " \
+       "import json; print(json.dumps({'s': time.perf_counter() - inicio, **arranque.memoria()}))"
+
+
+def medir_importacion(repeticiones):
+    resultados = []
+    lentos = {}
+    for _ in range(repeticiones):
+        r = subprocess.run([sys.executable, "-X", "importtime", "-c", HIJO], cwd=RAIZ,
+                           capture_output=True, text=True)
+        if r.returncode != 0:
+            sys.exit(r.stderr[-2000:])
+        resultados.append(json.loads(r.stdout.strip().splitlines()[-1]))
+        for m in RE_IMPORTTIME.finditer(r.stderr):
+            # Hasta dos niveles bajo "import app", ej. app -> flask -> werkzeug
+            if len(m.group(3)) <= 5:
+                lentos[m.group(4)] = max(lentos.get(m.group(4), 0), int(m.group(2)))
+    mejor = min(resultados, key=lambda x: x["s"])
+    print(f"import app: mejor {mejor['s'] * 1000:.0f} ms de {repeticiones}, "
+          + ", ".join(f"{k} {v} MB" for k, v in mejor.items() if k != "s"))
+    print("\nMódulos más lentos (acumulado):")
+    for nombre, us in sorted(lentos.items(), key=lambda x: -x[1])[:15]:
+        print(f"  {us / 1000:>8.1f} ms  {nombre}")
+
+
+def hijos(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def memoria_de(pid):
+    campos = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for linea in f:
+            nombre, _, resto = linea.partition(":")
+            if nombre in ("Rss", "Pss"):
+                campos[nombre] = int(resto.split()[0]) / 1024
+    return campos
+
+
+def medir_gunicorn(workers, precarga):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+    entorno = dict(os.environ, GUNICORN_PRELOAD="1" if precarga else "0", WEB_CONCURRENCY=str(workers))
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{puerto}", "app:app"],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    try:
+        listos = 0
+        for linea in proceso.stderr:
+            if "Worker listo" in linea:
+                listos += 1
+                if listos == workers:
+                    break
+        else:
+            sys.exit("gunicorn terminó antes de levantar los workers")
+        listo = time.perf_counter() - inicio
+        time.sleep(0.5)
+        master = memoria_de(proceso.pid)
+        trabajadores = [memoria_de(p) for p in hijos(proceso.pid)]
+        pss = master["Pss"] + sum(t["Pss"] for t in trabajadores)
+        print(f"precarga={int(precarga)}: {workers} workers listos en {listo:.2f}s, "
+              f"PSS total {pss:.0f} MB, por worker RSS {sum(t['Rss'] for t in trabajadores) / len(trabajadores):.0f} MB "
+              f"/ PSS {sum(t['Pss'] for t in trabajadores) / len(trabajadores):.0f} MB")
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--gunicorn", action="store_true")
+    parser.add_argument("-w", "--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    medir_importacion(args.repeticiones)
+    if args.gunicorn:
+        print()
+        for precarga in (False, True):
+            medir_gunicorn(args.workers, precarga)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Compara el índice de buscador.py con el filtro LIKE '%termino%' sobre un catálogo sintético.
+# No necesita base de datos:
+#
+#   python benchmarks/buscador_100k.py --productos 100000
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from buscador import IndiceProductos
+
+TIPOS = ["Cemento", "Saco arena", "Ripio", "Tubo PVC", "Codo PVC", "Llave de paso", "Tornillo", "Clavo",
+         "Cable eléctrico", "Interruptor", "Enchufe", "Grifería lavamanos", "Flexible", "Adaptador", "Pintura látex",
+         "Brocha", "Rodillo", "Martillo", "Destornillador", "Taladro", "Broca", "Sierra", "Silicona", "Teflón"]
+MARCAS = ["Polpaico", "Melón", "Bauker", "Stretto", "Vinilit", "Tigre", "Fanaloza", "Sherwin", "Ceresita", "Makita"]
+MEDIDAS = ["1/2", "3/4", "1", "20mm", "25mm", "32mm", "110mm", "2.5mm", "25kg", "1gl", "4gl", "6x1", "8x2"]
+CONSULTAS = ["cemento", "sacos de cemento", "tubo pvc 20mm", "codos", "llave paso 1/2", "griferia", "grifria",
+             "cables", "tornillos 6x1", "pintura latex", "adaptadores", "taladro makita", "siliconas", "xyz"]
+
+
+def catalogo(n, semilla=1):
+    azar = random.Random(semilla)
+    return [
+        (i, f"{azar.choice(TIPOS)} {azar.choice(MARCAS)} {azar.choice(MEDIDAS)} #{i}")
+        for i in range(1, n + 1)
+    ]
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+def medir(buscar, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        for consulta in CONSULTAS:
+            inicio = time.perf_counter()
+            buscar(consulta)
+            tiempos.append(1000 * (time.perf_counter() - inicio))
+    return statistics.median(tiempos), percentil(tiempos, 95), percentil(tiempos, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--productos", type=int, default=100_000)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    productos = catalogo(args.productos)
+
+    inicio = time.perf_counter()
+    indice = IndiceProductos()
+    for id_producto, nombre in productos:
+        indice.indexar(id_producto, nombre)
+    construccion = time.perf_counter() - inicio
+
+    minusculas = [(i, n.lower()) for i, n in productos]
+
+    def buscar_like(consulta):
+        termino = consulta.lower()
+        return [i for i, n in minusculas if termino in n]
+
+    def buscar_indice(consulta):
+        return indice.buscar(consulta, limite=5)
+
+    print(f"catálogo: {args.productos} productos, índice construido en {construccion:.2f}s")
+    print(f"{'método':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for nombre, buscar in (("like", buscar_like), ("indice", buscar_indice)):
+        p50, p95, p99 = medir(buscar, args.repeticiones)
+        print(f"{nombre:<10}{p50:>10.3f}{p95:>10.3f}{p99:>10.3f}")
+
+    print()
+    for consulta in CONSULTAS:
+        ids, total = indice.buscar(consulta, limite=1)
+        primero = indice.producto(ids[0])[0] if ids else "-"
+        print(f"{consulta!r:<22} {total:>6} coincidencias  -> {primero}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# Prueba de carga de /whatsapp: reproduce conversaciones completas (cliente nuevo -> buscar ->
+# elegir ID -> cantidad -> ver carrito -> finalizar) con varios usuarios en paralelo y reporta
+# latencia p50/p95/p99 y throughput por estado de la conversación.
+#
+# En el mismo proceso, con la base en memoria (no necesita Postgres):
+#   python benchmarks/carga.py --base memoria --usuarios 8 --conversaciones 50
+# En el mismo proceso contra Postgres (DB_HOST, DB_NAME, DB_USER, DB_PASS):
+#   python benchmarks/carga.py --base postgres
+# Contra gunicorn (el servidor debe tener WHATSAPP_ASINCRONO=0 para devolver las respuestas):
+#   python benchmarks/carga.py --url http://localhost:8000/whatsapp
+#   python benchmarks/carga.py --lanzar-gunicorn --base memoria
+import argparse
+import itertools
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+
+BUSQUEDAS = ["cemento", "tubo pvc", "llave de paso", "codos", "cable", "griferia", "adaptadores", "silicona"]
+RE_ID = re.compile(r"\*ID:\s*\*\s*`(\d+)`")
+_telefonos = itertools.count(1)
+_prefijo = f"+5699{random.randrange(1000, 9999)}"
+
+
+def guion(azar):
+    # (estado en que está la conversación al llegar el mensaje, mensaje o función que lo arma)
+    return [
+        ("nuevo_cliente", "Cliente Carga"),
+        ("menu:buscar", "1"),
+        ("buscando_producto", azar.choice(BUSQUEDAS)),
+        ("esperando_id_producto", lambda respuesta: RE_ID.search(respuesta).group(1)),
+        ("esperando_cantidad", str(azar.randrange(1, 10))),
+        ("menu:ver_carrito", "2"),
+        ("menu:finalizar", "3"),
+    ]
+
+
+def textos(twiml):
+    return "\n".join("".join(m.itertext()) for m in ET.fromstring(twiml).iter("Message"))
+
+
+class EnProceso:
+    def __init__(self):
+        from app import app
+        self._app = app
+        self._local = threading.local()
+
+    def enviar(self, datos):
+        cliente = getattr(self._local, "cliente", None)
+        if cliente is None:
+            cliente = self._local.cliente = self._app.test_client()
+        r = cliente.post("/whatsapp", data=datos)
+        if r.status_code != 200:
+            raise RuntimeError(f"HTTP {r.status_code}")
+        return r.get_data(as_text=True)
+
+
+class PorHttp:
+    def __init__(self, url):
+        import requests
+        self._requests = requests
+        self.url = url
+        self._local = threading.local()
+
+    def enviar(self, datos):
+        sesion = getattr(self._local, "sesion", None)
+        if sesion is None:
+            sesion = self._local.sesion = self._requests.Session()
+        r = sesion.post(self.url, data=datos, timeout=30)
+        r.raise_for_status()
+        return r.text
+
+
+def conversar(transporte, azar, tiempos, errores):
+    telefono = f"{_prefijo}{next(_telefonos):05d}"
+    anterior = ""
+    for estado, mensaje in guion(azar):
+        try:
+            cuerpo = mensaje(anterior) if callable(mensaje) else mensaje
+        except AttributeError:
+            errores[estado] += 1
+            return
+        datos = {"From": f"whatsapp:{telefono}", "Body": cuerpo, "MessageSid": f"SM{uuid.uuid4().hex}"}
+        inicio = time.perf_counter()
+        try:
+            anterior = textos(transporte.enviar(datos))
+        except Exception:
+            errores[estado] += 1
+            return
+        tiempos[estado].append(1000 * (time.perf_counter() - inicio))
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+def reportar(tiempos, errores, duracion, conversaciones):
+    print(f"\n{conversaciones} conversaciones en {duracion:.2f}s -> {conversaciones / duracion:.1f} conversaciones/s\n")
+    print(f"{'estado':<24}{'n':>7}{'err':>5}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'máx ms':>9}")
+    todos = []
+    for estado, _ in guion(random.Random(0)):
+        valores = tiempos.get(estado, [])
+        todos += valores
+        if not valores:
+            print(f"{estado:<24}{0:>7}{errores[estado]:>5}")
+            continue
+        print(f"{estado:<24}{len(valores):>7}{errores[estado]:>5}{len(valores) / duracion:>9.1f}"
+              f"{statistics.median(valores):>9.2f}{percentil(valores, 95):>9.2f}"
+              f"{percentil(valores, 99):>9.2f}{max(valores):>9.2f}")
+    if todos:
+        print(f"{'total':<24}{len(todos):>7}{sum(errores.values()):>5}{len(todos) / duracion:>9.1f}"
+              f"{statistics.median(todos):>9.2f}{percentil(todos, 95):>9.2f}"
+              f"{percentil(todos, 99):>9.2f}{max(todos):>9.2f}")
+
+
+def lanzar_gunicorn(args):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+    entorno = dict(os.environ, WHATSAPP_ASINCRONO="0", PORT=str(puerto))
+    comando = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{puerto}"]
+    if args.base == "memoria":
+        # La base en memoria vive dentro del worker: uno solo, con hilos
+        comando += ["--pythonpath", f"{RAIZ},{os.path.join(RAIZ, 'benchmarks')}", "-w", "1",
+                    "--threads", str(args.usuarios), "app_memoria:app"]
+    else:
+        comando += ["app:app"]
+    proceso = subprocess.Popen(comando, cwd=RAIZ, env=entorno)
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        try:
+            socket.create_connection(("127.0.0.1", puerto), timeout=1).close()
+            return proceso, f"http://127.0.0.1:{puerto}/whatsapp"
+        except OSError:
+            time.sleep(0.2)
+    proceso.terminate()
+    sys.exit("gunicorn no levantó en 60s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base", choices=["memoria", "postgres"], default="memoria")
+    parser.add_argument("--url", help="endpoint /whatsapp de un servidor ya levantado")
+    parser.add_argument("--lanzar-gunicorn", action="store_true")
+    parser.add_argument("--usuarios", type=int, default=8, help="conversaciones simultáneas")
+    parser.add_argument("--conversaciones", type=int, default=50, help="conversaciones por usuario")
+    parser.add_argument("--productos", type=int, default=5000, help="tamaño del catálogo en memoria")
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args()
+
+    gunicorn = None
+    if args.lanzar_gunicorn:
+        os.environ["CARGA_PRODUCTOS"] = str(args.productos)
+        gunicorn, args.url = lanzar_gunicorn(args)
+    if args.url:
+        transporte = PorHttp(args.url)
+    else:
+        os.environ.setdefault("WHATSAPP_ASINCRONO", "0")
+        if args.base == "memoria":
+            from memoria_bd import instalar
+            instalar(n_productos=args.productos)
+        transporte = EnProceso()
+
+    tiempos = defaultdict(list)
+    errores = defaultdict(int)
+    total = args.usuarios * args.conversaciones
+
+    def usuario(n):
+        azar = random.Random(args.semilla * 1000 + n)
+        for _ in range(args.conversaciones):
+            conversar(transporte, azar, tiempos, errores)
+
+    try:
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(args.usuarios) as ejecutor:
+            list(ejecutor.map(usuario, range(args.usuarios)))
+        reportar(tiempos, errores, time.perf_counter() - inicio, total)
+    finally:
+        if gunicorn is not None:
+            gunicorn.terminate()
+            gunicorn.wait()
+
+
+if __name__ == "__main__":
+    main()
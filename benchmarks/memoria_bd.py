@@ -0,0 +1,114 @@
+# Reemplazo en memoria de la capa de datos, para medir la app sin Postgres.
+# Sustituye las funciones que hablan con la base (carga y guardado del turno, catálogo,
+# carrito y transacción); el resto del flujo del webhook corre sin cambios.
+import itertools
+import random
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+TIPOS = ["Cemento", "Arena", "Ripio", "Tubo PVC", "Codo PVC", "Llave de paso", "Tornillo", "Cable",
+         "Interruptor", "Grifería lavamanos", "Flexible", "Adaptador", "Pintura látex", "Silicona"]
+MARCAS = ["Polpaico", "Melón", "Bauker", "Stretto", "Vinilit", "Tigre", "Fanaloza", "Sherwin"]
+MEDIDAS = ["1/2", "3/4", "20mm", "25mm", "32mm", "25kg", "1gl"]
+
+
+def catalogo(n, semilla=1):
+    azar = random.Random(semilla)
+    return {
+        i: (f"{azar.choice(TIPOS)} {azar.choice(MARCAS)} {azar.choice(MEDIDAS)}",
+            azar.randrange(500, 50_000), azar.randrange(0, 200), "unidad")
+        for i in range(1, n + 1)
+    }
+
+
+class BaseEnMemoria:
+    def __init__(self, productos):
+        self.productos = productos                  # id_producto -> (nombre, precio, stock, medida)
+        self.clientes = {}                          # telefono -> (id_cliente, nombre)
+        self.sesiones = {}                          # id_cliente -> (id_sesion, estado, dato_temp)
+        self.carritos = {}                          # id_cliente -> id_carrito activo
+        self.items = defaultdict(dict)              # id_carrito -> {id_producto: cantidad}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def cargar_turno(self, turno):
+        with self._lock:
+            cliente = self.clientes.get(turno.telefono)
+            if cliente:
+                turno.id_cliente, turno.nombre = cliente
+                turno.id_sesion, turno.estado, turno.dato_temp = self.sesiones.get(turno.id_cliente, (None, None, None))
+                turno.id_carrito = self.carritos.get(turno.id_cliente)
+        return turno
+
+    def guardar_turno(self, turno):
+        with self._lock:
+            if turno._nuevo_cliente:
+                turno.id_cliente = next(self._ids)
+                self.clientes[turno.telefono] = (turno.id_cliente, turno.nombre)
+            if turno._nueva_sesion:
+                self.sesiones[turno.id_cliente] = (next(self._ids), turno.estado, turno.dato_temp)
+            elif turno._sesion_modificada:
+                self.sesiones[turno.id_cliente] = (self.sesiones[turno.id_cliente][0], turno.estado, turno.dato_temp)
+            if turno._nuevo_carrito:
+                self.carritos[turno.id_cliente] = next(self._ids)
+            id_carrito = self.carritos.get(turno.id_cliente)
+            for id_producto, cantidad in turno._items.items():
+                items = self.items[id_carrito]
+                items[id_producto] = items.get(id_producto, 0) + cantidad
+            if turno._finalizar:
+                self.sesiones.pop(turno.id_cliente, None)
+        turno._nuevo_cliente = turno._nueva_sesion = turno._nuevo_carrito = False
+        turno._sesion_modificada = turno._finalizar = False
+        turno._items = {}
+
+    def precios(self, ids):
+        return [(i,) + self.productos[i] for i in ids if i in self.productos]
+
+    def leer_carrito(self, id_carrito):
+        lineas = sorted(
+            (self.productos[i][0], c, self.productos[i][1] * c) for i, c in self.items.get(id_carrito, {}).items()
+        )
+        return lineas, sum(subtotal for _, _, subtotal in lineas)
+
+
+def instalar(productos=None, n_productos=5000):
+    # Conecta la app a una BaseEnMemoria. Se llama antes de la primera petición.
+    import app
+    import buscador
+    import carrito
+    import catalogo as catalogo_app
+    import datos
+    import db
+    import recibidos
+
+    base = BaseEnMemoria(productos or catalogo(n_productos))
+
+    @contextmanager
+    def transaccion():
+        yield None
+
+    def cargar_indice():
+        indice = buscador.IndiceProductos()
+        for id_producto, (nombre, _, _, medida) in base.productos.items():
+            indice.indexar(id_producto, nombre, medida)
+        return indice
+
+    def buscar_productos(termino, pagina=1, por_pagina=catalogo_app.POR_PAGINA):
+        ids, total = buscador.obtener_indice().buscar(termino, limite=por_pagina, desde=(pagina - 1) * por_pagina)
+        return base.precios(ids), total
+
+    db.transaccion = transaccion
+    buscador.cargar_indice = cargar_indice
+    buscador._incorporar_nuevos = lambda: None
+    datos.Turno.cargar = classmethod(lambda cls, telefono: base.cargar_turno(cls(telefono)))
+    datos.Turno.guardar = lambda turno: base.guardar_turno(turno)
+    catalogo_app._leer_producto = lambda id_producto: (
+        (base.productos[id_producto][0], base.productos[id_producto][3]) if id_producto in base.productos else None
+    )
+    catalogo_app.buscar_productos = buscar_productos
+    app.buscar_productos = buscar_productos
+    carrito.leer_carrito = base.leer_carrito
+    # Sin Postgres no hay tabla de MessageSid
+    app.mensajes_recibidos = recibidos.RecibidosMemoria()
+    return base
@@ -0,0 +1,97 @@
+# Transiciones de sesión por segundo con el diseño original (una conexión y un UPDATE por
+# transición), con el pool (un UPDATE por transición) y con el almacén en memoria con
+# escritura diferida. Necesita una base con el esquema de la app.
+#
+#   python benchmarks/sesiones_throughput.py --clientes 200 --transiciones 20
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+from sesiones import AlmacenMemoria, Sesion
+
+ESTADOS = ["buscando_producto", "esperando_id_producto", "esperando_cantidad", "menu"]
+PREFIJO = "+bench-sesion-"
+
+
+def preparar(n):
+    with db.cursor() as cur:
+        cur.execute("SELECT id_cliente FROM clientes WHERE telefono LIKE %s", (PREFIJO + "%",))
+        limpiar(cur, [f[0] for f in cur.fetchall()])
+        ids = []
+        for i in range(n):
+            cur.execute("INSERT INTO clientes (nombre, telefono) VALUES (%s, %s) RETURNING id_cliente",
+                        ("Bench", f"{PREFIJO}{i}"))
+            id_cliente = cur.fetchone()[0]
+            cur.execute("INSERT INTO sesiones (id_cliente, estado) VALUES (%s, 'menu') RETURNING id_sesion", (id_cliente,))
+            ids.append((id_cliente, cur.fetchone()[0]))
+    return ids
+
+
+def limpiar(cur, clientes):
+    if clientes:
+        cur.execute("DELETE FROM sesiones WHERE id_cliente = ANY(%s)", (clientes,))
+        cur.execute("DELETE FROM clientes WHERE id_cliente = ANY(%s)", (clientes,))
+
+
+def con_conexion_nueva(ids, transiciones):
+    for paso in range(transiciones):
+        for id_cliente, _ in ids:
+            conn = db.conectar_db()
+            cur = conn.cursor()
+            cur.execute(
+                "UPDATE sesiones SET estado = %s, dato_temp = %s WHERE id_cliente = %s AND estado != 'finalizado'",
+                (ESTADOS[paso % len(ESTADOS)], str(paso), id_cliente)
+            )
+            conn.commit()
+            conn.close()
+
+
+def con_pool(ids, transiciones):
+    for paso in range(transiciones):
+        for id_cliente, _ in ids:
+            with db.cursor() as cur:
+                cur.execute(
+                    "UPDATE sesiones SET estado = %s, dato_temp = %s WHERE id_cliente = %s AND estado != 'finalizado'",
+                    (ESTADOS[paso % len(ESTADOS)], str(paso), id_cliente)
+                )
+
+
+def con_memoria(ids, transiciones):
+    # Sin hilo de fondo: se vuelca cada 1000 transiciones para medir el costo completo
+    almacen = AlmacenMemoria(automatico=False)
+    hechas = 0
+    for paso in range(transiciones):
+        for id_cliente, id_sesion in ids:
+            almacen.modificar(id_cliente, Sesion(id_sesion, ESTADOS[paso % len(ESTADOS)], str(paso)))
+            hechas += 1
+            if hechas % 1000 == 0:
+                almacen.volcar()
+    almacen.volcar()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clientes", type=int, default=200)
+    parser.add_argument("--transiciones", type=int, default=20)
+    args = parser.parse_args()
+
+    ids = preparar(args.clientes)
+    total = args.clientes * args.transiciones
+    try:
+        print(f"{'diseño':<18}{'transiciones/s':>16}{'total s':>10}")
+        for nombre, correr in (("conexion_nueva", con_conexion_nueva), ("pool", con_pool), ("memoria", con_memoria)):
+            inicio = time.perf_counter()
+            correr(ids, args.transiciones)
+            duracion = time.perf_counter() - inicio
+            print(f"{nombre:<18}{total / duracion:>16.0f}{duracion:>10.2f}")
+    finally:
+        with db.cursor() as cur:
+            limpiar(cur, [c for c, _ in ids])
+
+
+if __name__ == "__main__":
+    main()
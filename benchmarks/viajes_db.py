@@ -0,0 +1,108 @@
+# Cuenta los viajes de ida y vuelta a Postgres por cada paso de una conversación.
+# Necesita una base con el esquema de la app (variables DB_HOST, DB_NAME, DB_USER, DB_PASS).
+#
+#   python benchmarks/viajes_db.py --buscar cemento
+#
+# Termina con código 1 si algún paso supera su presupuesto, para detectar regresiones.
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Se mide el procesamiento completo dentro del webhook, sin pasar por la cola
+os.environ.setdefault("WHATSAPP_ASINCRONO", "0")
+
+import app as app_mod
+import db
+import recibidos
+from app import app
+
+# Máximo de viajes permitidos por paso (BEGIN y COMMIT incluidos). Cada paso lleva MessageSid
+# como en producción, así que incluye el INSERT del registro de recibidos (columna "sid").
+PRESUPUESTO = {
+    "nuevo_cliente": 5,
+    "menu_buscar": 5,
+    "buscar": 6,
+    "elegir_id": 6,
+    "cantidad": 5,
+    "ver_carrito": 5,
+    "finalizar": 5,
+    "volver": 5,
+}
+viajes_registro = []
+
+
+def contar_registro(agregar):
+    def envoltura(sid):
+        antes = db.viajes()
+        try:
+            return agregar(sid)
+        finally:
+            viajes_registro.append(db.viajes() - antes)
+    return envoltura
+
+
+def pasos(termino, id_producto):
+    return [
+        ("nuevo_cliente", "Cliente Benchmark"),
+        ("menu_buscar", "1"),
+        ("buscar", termino),
+        ("elegir_id", str(id_producto)),
+        ("cantidad", "2"),
+        ("ver_carrito", "2"),
+        ("finalizar", "3"),
+        ("volver", "hola"),
+    ]
+
+
+def primer_producto(termino):
+    with db.cursor() as cur:
+        cur.execute("SELECT id_producto FROM productos WHERE LOWER(nombre) LIKE %s LIMIT 1", (f"%{termino.lower()}%",))
+        fila = cur.fetchone()
+    if not fila:
+        sys.exit(f"No hay productos que coincidan con {termino!r}")
+    return fila[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buscar", default="cemento")
+    parser.add_argument("--telefono", default=f"+56900{int(time.time()) % 10_000_000:07d}")
+    args = parser.parse_args()
+
+    id_producto = primer_producto(args.buscar)
+    cliente = app.test_client()
+    registro = app_mod.mensajes_recibidos
+    registro.agregar = contar_registro(registro.agregar)
+    if isinstance(registro, recibidos.RecibidosBD):
+        # La tabla se crea con el primer mensaje de cada proceso; una sola vez, se cuenta aparte
+        antes = db.viajes()
+        registro._preparar()
+        print(f"preparar mensajes_recibidos: {db.viajes() - antes} viajes\n")
+    excedidos = []
+
+    print(f"{'paso':<15}{'viajes':>8}{'sid':>5}{'máx':>6}{'ms':>10}")
+    for paso, mensaje in pasos(args.buscar, id_producto):
+        antes = db.viajes()
+        viajes_registro.clear()
+        inicio = time.perf_counter()
+        r = cliente.post("/whatsapp", data={"From": f"whatsapp:{args.telefono}", "Body": mensaje,
+                                            "MessageSid": f"SM{uuid.uuid4().hex}"})
+        ms = 1000 * (time.perf_counter() - inicio)
+        usados = db.viajes() - antes
+        if r.status_code != 200:
+            sys.exit(f"{paso}: HTTP {r.status_code}")
+        maximo = PRESUPUESTO[paso]
+        marca = "  <-- excede" if usados > maximo else ""
+        print(f"{paso:<15}{usados:>8}{sum(viajes_registro):>5}{maximo:>6}{ms:>10.2f}{marca}")
+        if usados > maximo:
+            excedidos.append(paso)
+
+    if excedidos:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import bisect
+import heapq
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from itertools import combinations
+
+from db import cursor
+from tiempos import medido
+
+# Cada cuánto se incorporan los productos nuevos (id mayor al último indexado)
+BUSCADOR_REFRESCO = float(os.getenv("BUSCADOR_REFRESCO", "30"))
+# Cada cuánto se reconstruye el índice completo para recoger ediciones y borrados externos
+BUSCADOR_RECARGA = float(os.getenv("BUSCADOR_RECARGA", "900"))
+# Similitud mínima de trigramas para aceptar una palabra con errores de tipeo
+SIMILITUD_MINIMA = 0.4
+# Tope de palabras del índice que puede abarcar un prefijo
+MAX_PREFIJOS = 30
+
+VACIAS = {"de", "del", "la", "el", "los", "las", "un", "una", "y", "o", "a", "en", "con", "para", "por", "al"}
+
+RE_PALABRA = re.compile(r"[a-z0-9]+(?:[/.][0-9]+)*")
+
+
+def normalizar(texto):
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def raiz(palabra):
+    # Reducción mínima de plurales en español: sacos -> saco, adaptadores -> adaptador, luces -> luz.
+    # Se aplica igual al índice y a la consulta, así singular y plural caen en la misma raíz.
+    if len(palabra) > 3 and palabra.endswith("s") and not palabra[-2].isdigit():
+        palabra = palabra[:-1]
+    if len(palabra) > 4 and palabra.endswith("e") and palabra[-2] in "lrndj":
+        palabra = palabra[:-1]
+    elif len(palabra) > 3 and palabra.endswith("ce"):
+        palabra = palabra[:-2] + "z"
+    return palabra
+
+
+def palabras(texto):
+    return [raiz(p) for p in RE_PALABRA.findall(normalizar(texto))]
+
+
+def trigramas(palabra):
+    relleno = f"^{palabra}$"
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+class IndiceProductos:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._productos = {}                    # id_producto -> (nombre, medida, palabras)
+        self._invertido = defaultdict(set)      # palabra -> {id_producto}
+        self._trigramas = defaultdict(set)      # trigrama -> {palabra}
+        self._vocabulario = []                  # palabras ordenadas, para buscar por prefijo
+        self._desempate = {}                    # id_producto -> largo del nombre y id en un entero, nombres cortos primero
+        self.ultimo_id = 0
+
+    def __len__(self):
+        return len(self._productos)
+
+    def producto(self, id_producto):
+        nombre, medida, _ = self._productos[id_producto]
+        return nombre, medida
+
+    def indexar(self, id_producto, nombre, medida=None):
+        with self._lock:
+            if id_producto in self._productos:
+                self._quitar(id_producto)
+            propias = set(palabras(nombre))
+            self._productos[id_producto] = (nombre, medida, propias)
+            self._desempate[id_producto] = len(nombre) << 40 | id_producto
+            for palabra in propias:
+                if palabra not in self._invertido:
+                    bisect.insort(self._vocabulario, palabra)
+                    for t in trigramas(palabra):
+                        self._trigramas[t].add(palabra)
+                self._invertido[palabra].add(id_producto)
+            self.ultimo_id = max(self.ultimo_id, id_producto)
+
+    def quitar(self, id_producto):
+        with self._lock:
+            if id_producto in self._productos:
+                self._quitar(id_producto)
+
+    def _quitar(self, id_producto):
+        _, _, propias = self._productos.pop(id_producto)
+        del self._desempate[id_producto]
+        for palabra in propias:
+            ids = self._invertido[palabra]
+            ids.discard(id_producto)
+            if not ids:
+                del self._invertido[palabra]
+                self._vocabulario.pop(bisect.bisect_left(self._vocabulario, palabra))
+                for t in trigramas(palabra):
+                    self._trigramas[t].discard(palabra)
+
+    def _variantes(self, palabra):
+        # {palabra del índice: peso}: exacta, por prefijo y parecidas (errores de tipeo)
+        variantes = {}
+        if palabra in self._invertido:
+            variantes[palabra] = 1.0
+        if len(palabra) >= 3:
+            i = bisect.bisect_left(self._vocabulario, palabra)
+            fin = min(len(self._vocabulario), i + MAX_PREFIJOS)
+            while i < fin and self._vocabulario[i].startswith(palabra):
+                variantes.setdefault(self._vocabulario[i], 0.8)
+                i += 1
+        if len(palabra) >= 4 and not variantes:
+            propios = trigramas(palabra)
+            comunes = defaultdict(int)
+            for t in propios:
+                for candidata in self._trigramas.get(t, ()):
+                    comunes[candidata] += 1
+            for candidata, n in comunes.items():
+                similitud = n / (len(propios) + len(trigramas(candidata)) - n)
+                if similitud >= SIMILITUD_MINIMA:
+                    variantes[candidata] = 0.7 * similitud
+        return variantes
+
+    @medido("buscador.buscar")
+    def buscar(self, consulta, limite=5, desde=0):
+        # Devuelve (ids de la página, total de coincidencias), ordenados por relevancia
+        with self._lock:
+            buscadas = [p for p in dict.fromkeys(palabras(consulta)) if p not in VACIAS]
+            if not buscadas or not self._productos:
+                return [], 0
+            total_docs = len(self._productos)
+            # Por cada palabra buscada: [(peso, ids)] de sus variantes, de mayor a menor peso
+            grupos = []
+            for palabra in buscadas:
+                variantes = [
+                    (peso * math.log(1 + total_docs / len(self._invertido[v])), self._invertido[v])
+                    for v, peso in self._variantes(palabra).items()
+                ]
+                if variantes:
+                    variantes.sort(key=lambda x: -x[0])
+                    grupos.append(variantes)
+            if not grupos:
+                return [], 0
+
+            conjuntos = sorted(
+                (g[0][1] if len(g) == 1 else set().union(*(ids for _, ids in g)) for g in grupos),
+                key=len,
+            )
+            candidatos = conjuntos[0].intersection(*conjuntos[1:])
+            completos = bool(candidatos)
+            if not completos:
+                # Ningún producto tiene todas las palabras: se muestran los que tengan más
+                for cuantas in range(len(conjuntos) - 1, 0, -1):
+                    candidatos = set().union(*(c[0].intersection(*c[1:]) for c in combinations(conjuntos, cuantas)))
+                    if candidatos:
+                        break
+
+            desempate = self._desempate
+            if completos and all(len(g) == 1 for g in grupos):
+                # Cada palabra tiene una sola variante y todos la contienen: empatan en puntaje
+                clave = desempate.__getitem__
+            else:
+                puntajes = dict.fromkeys(candidatos, 0.0)
+                for grupo in grupos:
+                    vistos = set()
+                    for peso, ids in grupo:
+                        for id_producto in (ids & candidatos) - vistos:
+                            puntajes[id_producto] += peso
+                            vistos.add(id_producto)
+
+                def clave(id_producto):
+                    return -puntajes[id_producto], desempate[id_producto]
+
+            elegidos = heapq.nsmallest(desde + limite, candidatos, key=clave)
+            return elegidos[desde:], len(candidatos)
+
+
+indice = IndiceProductos()
+_refresco_lock = threading.Lock()
+_refrescado = 0.0
+_recargado = 0.0
+
+
+@medido("buscador.cargar_indice")
+def cargar_indice():
+    nuevo = IndiceProductos()
+    with cursor() as cur:
+        cur.execute("SELECT id_producto, nombre, medida FROM productos")
+        for id_producto, nombre, medida in cur:
+            nuevo.indexar(id_producto, nombre, medida)
+    return nuevo
+
+
+@medido("buscador.incorporar_nuevos")
+def _incorporar_nuevos():
+    global _refrescado
+    with cursor() as cur:
+        cur.execute(
+            "SELECT id_producto, nombre, medida FROM productos WHERE id_producto > %s ORDER BY id_producto",
+            (indice.ultimo_id,)
+        )
+        for id_producto, nombre, medida in cur.fetchall():
+            indice.indexar(id_producto, nombre, medida)
+    _refrescado = time.monotonic()
+
+
+def obtener_indice():
+    ahora = time.monotonic()
+    if not _recargado:
+        with _refresco_lock:
+            if not _recargado:
+                _recargar_sin_lock()
+    elif ahora - _recargado > BUSCADOR_RECARGA:
+        if _refresco_lock.acquire(blocking=False):
+            # La reconstrucción completa corre aparte; mientras tanto se sigue usando el índice actual
+            threading.Thread(target=_recarga_en_segundo_plano, daemon=True).start()
+    elif ahora - _refrescado > BUSCADOR_REFRESCO:
+        if _refresco_lock.acquire(blocking=False):
+            try:
+                _incorporar_nuevos()
+            finally:
+                _refresco_lock.release()
+    return indice
+
+
+def _recargar_sin_lock():
+    global indice, _recargado, _refrescado
+    indice = cargar_indice()
+    _recargado = _refrescado = time.monotonic()
+
+
+def _recarga_en_segundo_plano():
+    try:
+        _recargar_sin_lock()
+    finally:
+        _refresco_lock.release()
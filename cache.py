@@ -0,0 +1,173 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Backend compartido opcional para que todos los workers de gunicorn vean las mismas
+# entradas e invalidaciones, ej. "redis://localhost:6379/1"
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+# Con backend compartido, la copia local de cada worker dura como máximo esto (segundos)
+CACHE_TTL_LOCAL = float(os.getenv("CACHE_TTL_LOCAL", "5"))
+
+_FALTA = object()
+
+
+class CacheLocal:
+    # TTL por entrada y expulsión LRU cuando se supera el máximo
+    def __init__(self, maximo, ttl):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._datos = OrderedDict()  # clave -> (vence, valor)
+        self._lock = threading.Lock()
+        self.expulsiones = 0
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return _FALTA
+            vence, valor = entrada
+            if vence < time.monotonic():
+                del self._datos[clave]
+                return _FALTA
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._guardar(clave, valor)
+
+    def agregar(self, clave, valor):
+        # Guarda solo si la clave no existe (o venció); devuelve si la guardó
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and entrada[0] >= time.monotonic():
+                return False
+            self._guardar(clave, valor)
+            return True
+
+    def _guardar(self, clave, valor):
+        self._datos[clave] = (time.monotonic() + self.ttl, valor)
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.maximo:
+            self._datos.popitem(last=False)
+            self.expulsiones += 1
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+
+class CacheRedis:
+    def __init__(self, nombre, ttl, url=CACHE_REDIS_URL):
+        if redis is None:
+            raise RuntimeError("CACHE_REDIS_URL está configurado pero el paquete redis no está instalado")
+        self.prefijo = f"cache:{nombre}:"
+        self.ttl = ttl
+        self._redis = redis.Redis.from_url(url)
+
+    def obtener(self, clave):
+        datos = self._redis.get(self.prefijo + str(clave))
+        return _FALTA if datos is None else pickle.loads(datos)
+
+    def guardar(self, clave, valor):
+        self._redis.set(self.prefijo + str(clave), pickle.dumps(valor), ex=max(1, int(self.ttl)))
+
+    def invalidar(self, clave):
+        self._redis.delete(self.prefijo + str(clave))
+
+    def limpiar(self):
+        for clave in self._redis.scan_iter(self.prefijo + "*"):
+            self._redis.delete(clave)
+
+
+class Cache:
+    def __init__(self, nombre, maximo=10_000, ttl=300, guardar_vacios=True):
+        self.nombre = nombre
+        self.guardar_vacios = guardar_vacios
+        if CACHE_REDIS_URL:
+            self._local = CacheLocal(maximo, min(ttl, CACHE_TTL_LOCAL))
+            self._compartido = CacheRedis(nombre, ttl)
+        else:
+            self._local = CacheLocal(maximo, ttl)
+            self._compartido = None
+        self.aciertos = 0
+        self.aciertos_compartido = 0
+        self.fallos = 0
+        CACHES[nombre] = self
+
+    def leer(self, clave, cargar):
+        valor = self._local.obtener(clave)
+        if valor is not _FALTA:
+            self.aciertos += 1
+            return valor
+        if self._compartido is not None:
+            valor = self._compartido.obtener(clave)
+            if valor is not _FALTA:
+                self.aciertos_compartido += 1
+                self._local.guardar(clave, valor)
+                return valor
+        self.fallos += 1
+        valor = cargar()
+        if valor is not None or self.guardar_vacios:
+            self.guardar(clave, valor)
+        return valor
+
+    def obtener(self, clave, defecto=None):
+        valor = self._local.obtener(clave)
+        if valor is _FALTA and self._compartido is not None:
+            valor = self._compartido.obtener(clave)
+            if valor is not _FALTA:
+                self._local.guardar(clave, valor)
+        if valor is _FALTA:
+            self.fallos += 1
+            return defecto
+        self.aciertos += 1
+        return valor
+
+    def guardar(self, clave, valor):
+        self._local.guardar(clave, valor)
+        if self._compartido is not None:
+            self._compartido.guardar(clave, valor)
+
+    def invalidar(self, clave):
+        self._local.invalidar(clave)
+        if self._compartido is not None:
+            self._compartido.invalidar(clave)
+
+    def limpiar(self):
+        self._local.limpiar()
+        if self._compartido is not None:
+            self._compartido.limpiar()
+
+    def metricas(self):
+        consultas = self.aciertos + self.aciertos_compartido + self.fallos
+        return {
+            "entradas": len(self._local),
+            "aciertos": self.aciertos,
+            "aciertos_compartido": self.aciertos_compartido,
+            "fallos": self.fallos,
+            "expulsiones": self._local.expulsiones,
+            "tasa_aciertos": round((self.aciertos + self.aciertos_compartido) / consultas, 4) if consultas else 0.0,
+            "compartido": self._compartido is not None,
+        }
+
+
+CACHES = {}
+
+
+def metricas():
+    return {nombre: c.metricas() for nombre, c in CACHES.items()}
@@ -0,0 +1,293 @@
+import math
+import os
+import re
+import unicodedata
+
+import buscador
+from tiempos import medido
+
+SACO_CEMENTO_KG = 25
+# Margen por pérdidas en obra
+PERDIDA = 1.05
+
+# Dosificación por m³ de material terminado
+DOSIFICACIONES = {
+    "radier": {"cemento_kg": 300, "arena_m3": 0.52, "ripio_m3": 0.84},     # H-20
+    "hormigon": {"cemento_kg": 340, "arena_m3": 0.50, "ripio_m3": 0.80},   # H-25
+    "mortero": {"cemento_kg": 450, "arena_m3": 1.05, "ripio_m3": 0.0},     # 1:3
+}
+NOMBRES_TRABAJO = {"radier": "radier", "hormigon": "hormigón", "mortero": "mortero"}
+# Espesor por defecto (m) cuando el mensaje trae solo la superficie
+ESPESOR_DEFECTO = {"radier": 0.10, "hormigon": 0.10, "mortero": 0.02}
+
+TRABAJOS = [
+    ("mortero", ("mortero", "pega", "estuco", "revoque")),
+    ("hormigon", ("hormigon", "concreto", "losa", "cimiento", "fundacion", "pilar", "viga")),
+    ("radier", ("radier", "piso", "contrapiso")),
+]
+
+# Búsqueda en el catálogo para cada material
+MATERIALES_PRODUCTO = {"cemento": "cemento", "arena": "arena", "ripio": "ripio"}
+# Producto a sugerir por material, ej. CALCULO_PRODUCTO_CEMENTO=123. Sin id configurado se toma el
+# primer resultado de la búsqueda cuya presentación (kg o m³ en el nombre o la medida) sirva para el cálculo.
+PRODUCTOS_CALCULO = {m: int(os.getenv(f"CALCULO_PRODUCTO_{m.upper()}", "0")) or None for m in MATERIALES_PRODUCTO}
+CANDIDATOS_CALCULO = 20
+# Kilos por unidad aceptables; deja fuera, por ejemplo, el cemento de contacto en tarro de 1 kg
+RANGO_KG = {"cemento": (20, 50), "arena": (10, 100), "ripio": (10, 100)}
+# Densidad aparente (kg/m³) de los áridos vendidos en sacos por peso
+DENSIDAD_KG_M3 = {"arena": 1600, "ripio": 1500}
+
+NUMERO = r"(?<![\d.])(\d+(?:\.\d+)?)"
+# Unidad de largo opcional después de un número; la más larga primero
+LARGO = r"(?:\s*(centimetros?|milimetros?|metros?|mts?|cm|mm|m)(?![a-z0-9]))?"
+POR = r"\s*(?:x|por|\*)\s*"
+RE_VOLUMEN = re.compile(NUMERO + r"\s*(?:m3|mt3|mts3|metros? cubicos?)")
+RE_AREA = re.compile(NUMERO + r"\s*(?:m2|mt2|mts2|metros? cuadrados?)")
+# Largo x ancho x alto, y largo x ancho
+RE_TRES_MEDIDAS = re.compile(NUMERO + LARGO + POR + NUMERO + LARGO + POR + NUMERO + LARGO)
+RE_DOS_MEDIDAS = re.compile(NUMERO + LARGO + POR + NUMERO + LARGO)
+# Proporciones de mezcla como "1:3" o "1:2:3"; no son medidas
+RE_PROPORCION = re.compile(NUMERO + r"\s*:\s*\d+(?:\.\d+)?(?:\s*:\s*\d+(?:\.\d+)?)*")
+# Espesor: "15 cm", "espesor 0.15 m", "0.15 m de espesor"
+ESPESOR = r"(?:espesor|grosor|altura|alto)"
+RE_ESPESOR_UNIDAD = re.compile(NUMERO + r"\s*(centimetros?|milimetros?|cm|mm)(?![a-z0-9])")
+RE_ESPESOR_ANTES = re.compile(ESPESOR + r"\s*(?:de\s*)?" + NUMERO + LARGO)
+RE_ESPESOR_DESPUES = re.compile(NUMERO + LARGO + r"\s*de\s*" + ESPESOR)
+ESPESOR_MAXIMO = 1.0
+# Un radier o muro con un lado más corto que esto es casi seguro una medida mal leída
+LADO_MINIMO = 0.3
+RE_ENVASE_KG = re.compile(NUMERO + r"\s*(?:kg|kilos?)(?![a-z])")
+RE_ENVASE_M3 = re.compile(r"(?:" + NUMERO + r"\s*)?(?:m3|mt3|mts3|metros? cubicos?)")
+
+def normalizar(texto):
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = texto.replace("²", "2").replace("³", "3")
+    # "2,5" -> "2.5"
+    return re.sub(r"(\d),(\d)", r"\1.\2", texto)
+
+
+def detectar_trabajo(texto):
+    for trabajo, palabras in TRABAJOS:
+        if any(p in texto for p in palabras):
+            return trabajo
+    return "radier"
+
+
+def a_metros(valor, unidad):
+    # None si el número no trae unidad
+    if not unidad:
+        return None
+    if unidad.startswith("c"):
+        return valor / 100
+    if unidad.startswith("mi") or unidad == "mm":
+        return valor / 1000
+    return valor
+
+
+def leer_lados(largo, u_largo, ancho, u_ancho):
+    # (largo_m, ancho_m) o None. "10 x 10 cm" puede ser 10 m por 10 cm o 10 cm por lado: si un lado
+    # no trae unidad y el otro viene en cm o mm no se adivina.
+    if (u_largo is None) != (u_ancho is None) and a_metros(1, u_largo or u_ancho) < 1:
+        return None
+    largo = a_metros(float(largo), u_largo or "m")
+    ancho = a_metros(float(ancho), u_ancho or "m")
+    if min(largo, ancho) < LADO_MINIMO:
+        return None
+    return largo, ancho
+
+
+def leer_espesor(texto):
+    # Devuelve el espesor en metros, None si no viene y False si es ambiguo
+    encontrados = set()
+    for m in RE_ESPESOR_UNIDAD.finditer(texto):
+        encontrados.add(a_metros(float(m.group(1)), m.group(2)))
+    for regex in (RE_ESPESOR_ANTES, RE_ESPESOR_DESPUES):
+        for m in regex.finditer(texto):
+            valor = float(m.group(1))
+            metros = a_metros(valor, m.group(2))
+            if metros is None:
+                # "espesor 0.15" solo puede ser metros; "espesor 10" podría ser cm
+                if valor >= 1:
+                    return False
+                metros = valor
+            encontrados.add(metros)
+    if not encontrados:
+        return None
+    if len(encontrados) > 1:
+        return False
+    return encontrados.pop()
+
+
+def leer_medidas(texto):
+    # (area_m2, espesor_m, volumen_m3) o None si no hay medidas o se pueden leer de más de una forma.
+    # Con medidas ambiguas es mejor que responda el modelo que dar una cantidad equivocada.
+    texto = RE_PROPORCION.sub(" ", texto)
+
+    volumenes = RE_VOLUMEN.findall(texto)
+    if volumenes:
+        if len(volumenes) > 1:
+            return None
+        return None, None, float(volumenes[0])
+
+    triples = list(RE_TRES_MEDIDAS.finditer(texto))
+    if triples:
+        if len(triples) > 1:
+            return None
+        largo, u_largo, ancho, u_ancho, alto, u_alto = triples[0].groups()
+        lados = leer_lados(largo, u_largo, ancho, u_ancho)
+        if lados is None:
+            return None
+        largo, ancho = lados
+        espesor = a_metros(float(alto), u_alto)
+        if espesor is None:
+            # "5x4x0.15" son metros; "5x4x10" puede ser 10 cm o 10 m
+            if float(alto) >= 1:
+                return None
+            espesor = float(alto)
+        if not 0 < espesor <= ESPESOR_MAXIMO:
+            return None
+        return largo * ancho, espesor, largo * ancho * espesor
+
+    candidatas = [float(a) for a in RE_AREA.findall(texto)]
+    for m in RE_DOS_MEDIDAS.finditer(texto):
+        largo, u_largo, ancho, u_ancho = m.groups()
+        if not u_largo and not u_ancho and float(largo) == 1:
+            # "1 por 3" o "1 x 4" sin unidades es una proporción de mezcla
+            continue
+        lados = leer_lados(largo, u_largo, ancho, u_ancho)
+        if lados is None:
+            return None
+        candidatas.append(lados[0] * lados[1])
+        # Lo que sigue a las dimensiones no se confunde con un espesor
+        texto = texto[:m.start()] + " " * (m.end() - m.start()) + texto[m.end():]
+    if len(candidatas) != 1:
+        return None
+    area = candidatas[0]
+
+    espesor = leer_espesor(texto)
+    if espesor is False:
+        return None
+    if espesor is not None and not 0 < espesor <= ESPESOR_MAXIMO:
+        return None
+    return area, espesor, None
+
+
+@medido("calculadora.calcular")
+def calcular_materiales(mensaje):
+    # Devuelve None si el mensaje no trae medidas suficientes o son ambiguas; en ese caso responde el modelo
+    texto = normalizar(mensaje)
+    trabajo = detectar_trabajo(texto)
+
+    medidas = leer_medidas(texto)
+    if medidas is None:
+        return None
+    area, espesor, volumen = medidas
+    if volumen is None:
+        if espesor is None:
+            espesor = ESPESOR_DEFECTO[trabajo]
+        volumen = area * espesor
+
+    if volumen <= 0:
+        return None
+
+    dosis = DOSIFICACIONES[trabajo]
+    volumen_obra = volumen * PERDIDA
+    return {
+        "trabajo": trabajo,
+        "area_m2": area,
+        "espesor_m": espesor,
+        "volumen_m3": volumen,
+        "cemento_kg": round(volumen_obra * dosis["cemento_kg"], 2),
+        "cemento_sacos": math.ceil(volumen_obra * dosis["cemento_kg"] / SACO_CEMENTO_KG),
+        "arena_m3": round(volumen_obra * dosis["arena_m3"], 2),
+        "ripio_m3": round(volumen_obra * dosis["ripio_m3"], 2),
+    }
+
+
+def presentacion(material, nombre, medida):
+    # Cuánto trae una unidad del producto: ("kg", 25.0), ("m3", 1.0), o None si no se sabe
+    texto = normalizar(f"{nombre} {medida or ''}")
+    m = RE_ENVASE_KG.search(texto)
+    if m:
+        kilos = float(m.group(1))
+        minimo, maximo = RANGO_KG[material]
+        return ("kg", kilos) if minimo <= kilos <= maximo else None
+    if material != "cemento":
+        m = RE_ENVASE_M3.search(texto)
+        if m:
+            return "m3", float(m.group(1) or 1)
+    return None
+
+
+def productos_materiales():
+    # {material: (id_producto, nombre, medida, presentación)}; falta el material si ningún producto sirve
+    indice = buscador.obtener_indice()
+    productos = {}
+    for material, consulta in MATERIALES_PRODUCTO.items():
+        if PRODUCTOS_CALCULO[material]:
+            candidatos = [PRODUCTOS_CALCULO[material]]
+        else:
+            candidatos, _ = indice.buscar(consulta, limite=CANDIDATOS_CALCULO)
+        for id_producto in candidatos:
+            try:
+                nombre, medida = indice.producto(id_producto)
+            except KeyError:
+                continue
+            envase = presentacion(material, nombre, medida)
+            if envase:
+                productos[material] = (id_producto, nombre, medida, envase)
+                break
+    return productos
+
+
+@medido("calculadora.productos")
+def productos_para_calculo(calculo):
+    # [(id_producto, nombre, medida, cantidad)] listos para agregar al carrito
+    productos = productos_materiales()
+    necesidades = [
+        ("cemento", "kg", calculo["cemento_kg"]),
+        ("arena", "m3", calculo["arena_m3"]),
+        ("ripio", "m3", calculo["ripio_m3"]),
+    ]
+    sugeridos = []
+    for material, unidad, necesario in necesidades:
+        if not necesario or material not in productos:
+            continue
+        id_producto, nombre, medida, (unidad_envase, contenido) = productos[material]
+        if unidad_envase != unidad:
+            # Áridos en sacos por peso: se pasa el volumen a kilos
+            necesario = necesario * DENSIDAD_KG_M3[material]
+        # El redondeo evita que 300.0000001 kg se conviertan en un saco extra
+        sugeridos.append((id_producto, nombre, medida, math.ceil(round(necesario / contenido, 6))))
+    return sugeridos
+
+
+def formatear_calculo(calculo, sugeridos):
+    if calculo["area_m2"] is not None:
+        medidas = f"{calculo['area_m2']:g} m² × {calculo['espesor_m'] * 100:g} cm = {calculo['volumen_m3']:.2f} m³"
+    else:
+        medidas = f"{calculo['volumen_m3']:g} m³"
+    texto = (
+        f"📐 *Cálculo para {NOMBRES_TRABAJO[calculo['trabajo']]}* ({medidas})\n"
+        "──────────────────────────\n"
+        f"🧱 Cemento: *{calculo['cemento_sacos']}* sacos de {SACO_CEMENTO_KG} kg\n"
+        f"🏖️ Arena: *{calculo['arena_m3']:g}* m³\n"
+    )
+    if calculo["ripio_m3"]:
+        texto += f"🪨 Ripio: *{calculo['ripio_m3']:g}* m³\n"
+    texto += f"──────────────────────────\n(Incluye {round((PERDIDA - 1) * 100)}% de pérdida)\n"
+    if sugeridos:
+        texto += "\n🛒 *Productos sugeridos:*\n"
+        for id_producto, nombre, medida, cantidad in sugeridos:
+            texto += f"🔹 `{id_producto}` {nombre}: {cantidad} {medida}\n"
+        texto += "\n✅ Responde *si* para agregarlos al carrito o cualquier otra cosa para volver al menú."
+    return texto
+
+
+def codificar_sugeridos(sugeridos):
+    return ",".join(f"{id_producto}:{cantidad}" for id_producto, _, _, cantidad in sugeridos)
+
+
+def decodificar_sugeridos(dato_temp):
+    return [tuple(int(x) for x in par.split(":")) for par in (dato_temp or "").split(",") if par]
@@ -0,0 +1,97 @@
+from db import cursor
+from tiempos import medido
+
+# Twilio rechaza los mensajes de WhatsApp de más de 1600 caracteres
+LIMITE_MENSAJE = 1600
+SEPARADOR = "────────────────────────────────────────\n"
+
+# Una línea por producto aunque haya filas repetidas de antes del upsert; subtotales y total
+# los calcula Postgres
+SQL_CARRITO = """
+    SELECT p.nombre, SUM(c.cantidad) AS cantidad,
+           p.precio * SUM(c.cantidad) AS subtotal,
+           SUM(p.precio * SUM(c.cantidad)) OVER () AS total
+    FROM carrito_items c
+    JOIN productos p ON p.id_producto = c.id_producto
+    WHERE c.id_carrito = %s
+    GROUP BY c.id_producto, p.nombre, p.precio
+    ORDER BY p.nombre, c.id_producto
+"""
+
+# Suma la cantidad si el producto ya está en el carrito; si no, lo agrega.
+# carrito_items no tiene clave única, así que se actualiza una sola fila por ctid.
+SQL_SUMAR_ITEM = """
+    WITH sumado AS (
+        UPDATE carrito_items SET cantidad = cantidad + %s
+        WHERE ctid = (
+            SELECT ctid FROM carrito_items WHERE id_carrito = {carrito} AND id_producto = %s LIMIT 1
+        )
+        RETURNING 1
+    )
+    INSERT INTO carrito_items (id_carrito, id_producto, cantidad)
+    SELECT {carrito}, %s, %s WHERE NOT EXISTS (SELECT 1 FROM sumado)
+"""
+
+
+def sentencia_sumar_item(carrito_sql, carrito_params, id_producto, cantidad):
+    return (
+        SQL_SUMAR_ITEM.format(carrito=carrito_sql),
+        (cantidad,) + carrito_params + (id_producto,) + carrito_params + (id_producto, cantidad),
+    )
+
+
+@medido("db.leer_carrito")
+def leer_carrito(id_carrito):
+    # ([(nombre, cantidad, subtotal)], total)
+    with cursor() as cur:
+        cur.execute(SQL_CARRITO, (id_carrito,))
+        filas = cur.fetchall()
+    if not filas:
+        return [], 0
+    return [fila[:3] for fila in filas], filas[0][3]
+
+
+def pesos(monto):
+    # Punto como separador de miles, como se escribe en Chile
+    return f"${monto:,.0f}".replace(",", ".")
+
+
+def largo_mensaje(texto):
+    # Twilio cuenta unidades UTF-16: los emojis valen 2
+    return len(texto.encode("utf-16-le")) // 2
+
+
+@medido("carrito.formatear")
+def formatear_carrito(lineas, total, limite=LIMITE_MENSAJE):
+    # Devuelve uno o más mensajes, cada uno bajo el límite de WhatsApp
+    titulo = "🛒 *Tu carrito contiene:*"
+    columnas = "📦 *Producto*         |  🔢 *Cant.*  |  💲 *Subtotal*\n" + SEPARADOR
+    pie = SEPARADOR + f"💰 *Total:* {pesos(total)}"
+    # Espacio para el título con la numeración "(12/34)"
+    disponible = limite - largo_mensaje(titulo + columnas + pie) - 20
+
+    paginas = [[]]
+    largo = 0
+    for nombre, cantidad, subtotal in lineas:
+        linea = f"🔹 {nombre.ljust(15)[:15]} | {str(cantidad).rjust(5)}     | {pesos(subtotal)}\n"
+        if paginas[-1] and largo + largo_mensaje(linea) > disponible:
+            paginas.append([])
+            largo = 0
+        paginas[-1].append(linea)
+        largo += largo_mensaje(linea)
+
+    mensajes = []
+    for i, pagina in enumerate(paginas, 1):
+        encabezado = titulo if len(paginas) == 1 else f"{titulo} ({i}/{len(paginas)})"
+        texto = f"{encabezado}\n\n{columnas}{''.join(pagina)}"
+        if i == len(paginas):
+            texto += pie
+        mensajes.append(texto)
+    return mensajes
+
+
+def resumen_carrito(id_carrito):
+    # Mensajes del resumen, o [] si el carrito está vacío. Sin caché: el resumen se lee en cada
+    # vista para que precios y cantidades estén siempre al día en todos los workers.
+    lineas, total = leer_carrito(id_carrito)
+    return formatear_carrito(lineas, total) if lineas else []
@@ -0,0 +1,130 @@
+import logging
+import os
+import select
+import threading
+import time
+
+import buscador
+import db
+from cache import Cache
+from db import cursor
+from tiempos import medido
+
+log = logging.getLogger(__name__)
+
+POR_PAGINA = 5
+
+# id_producto -> (nombre, medida). Precio y stock nunca pasan por caché.
+productos_cache = Cache("productos", maximo=20_000, ttl=600)
+
+# Cada worker escucha este canal y refresca su caché y su índice con cada producto modificado.
+# actualizar_producto() avisa siempre. Para que también avisen las ediciones hechas fuera de la
+# app (SQL a mano, otro sistema) hay que instalar SQL_AVISO_PRODUCTOS una vez en la base; sin
+# el trigger esas ediciones se ven al vencer productos_cache (10 min) y en la próxima recarga
+# completa del índice (BUSCADOR_RECARGA).
+CANAL_PRODUCTOS = "productos_cambiados"
+CATALOGO_AVISOS = os.getenv("CATALOGO_AVISOS", "1") == "1"
+SQL_AVISO_PRODUCTOS = f"""
+    CREATE OR REPLACE FUNCTION avisar_producto_cambiado() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{CANAL_PRODUCTOS}', COALESCE(NEW.id_producto, OLD.id_producto)::text);
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+    DROP TRIGGER IF EXISTS productos_cambiados ON productos;
+    CREATE TRIGGER productos_cambiados AFTER INSERT OR UPDATE OR DELETE ON productos
+        FOR EACH ROW EXECUTE FUNCTION avisar_producto_cambiado();
+"""
+
+
+@medido("catalogo.buscar_productos")
+def buscar_productos(termino, pagina=1, por_pagina=POR_PAGINA):
+    # Devuelve ([(id_producto, nombre, precio, stock, medida)], total de coincidencias).
+    # El índice solo conoce nombres; precio y stock se leen siempre de la base.
+    ids, total = buscador.obtener_indice().buscar(termino, limite=por_pagina, desde=(pagina - 1) * por_pagina)
+    if not ids:
+        return [], total
+    with cursor() as cur:
+        cur.execute(
+            "SELECT id_producto, nombre, precio, stock, medida FROM productos WHERE id_producto = ANY(%s)",
+            (ids,)
+        )
+        filas = {fila[0]: fila for fila in cur.fetchall()}
+    return [filas[i] for i in ids if i in filas], total
+
+
+def buscar_producto_por_id(id_producto):
+    return productos_cache.leer(id_producto, lambda: _leer_producto(id_producto))
+
+
+@medido("catalogo.leer_producto")
+def _leer_producto(id_producto):
+    with cursor() as cur:
+        cur.execute(
+            "SELECT nombre, medida FROM productos WHERE id_producto = %s",
+            (id_producto,)
+        )
+        return cur.fetchone()
+
+
+def actualizar_producto(id_producto, nombre=None, medida=None, precio=None, stock=None):
+    with cursor() as cur:
+        cur.execute(
+            """
+            UPDATE productos SET
+                nombre = COALESCE(%s, nombre),
+                medida = COALESCE(%s, medida),
+                precio = COALESCE(%s, precio),
+                stock = COALESCE(%s, stock)
+            WHERE id_producto = %s
+            RETURNING nombre, medida
+            """,
+            (nombre, medida, precio, stock, id_producto)
+        )
+        fila = cur.fetchone()
+        if fila:
+            # Llega a los demás workers al confirmarse la transacción
+            cur.execute("SELECT pg_notify(%s, %s)", (CANAL_PRODUCTOS, str(id_producto)))
+    if fila and (nombre is not None or medida is not None):
+        productos_cache.invalidar(id_producto)
+        buscador.indice.indexar(id_producto, *fila)
+    return fila is not None
+
+
+def refrescar_producto(id_producto):
+    productos_cache.invalidar(id_producto)
+    fila = _leer_producto(id_producto)
+    if fila:
+        buscador.indice.indexar(id_producto, *fila)
+    else:
+        buscador.indice.quitar(id_producto)
+
+
+def escuchar_cambios():
+    # Hilo por worker con una conexión propia fuera del pool: LISTEN necesita autocommit
+    # y quedarse esperando en select()
+    if CATALOGO_AVISOS:
+        threading.Thread(target=_escuchar, name="catalogo", daemon=True).start()
+
+
+def _escuchar():
+    while True:
+        conn = None
+        try:
+            conn = db.conectar_db()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CANAL_PRODUCTOS}")
+            # Lo que cambió mientras no se escuchaba ya no llegará como aviso
+            productos_cache.limpiar()
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    aviso = conn.notifies.pop(0)
+                    refrescar_producto(int(aviso.payload))
+        except Exception:
+            log.exception("Se cortó la escucha de cambios del catálogo; se reintenta en 5 s")
+            if conn is not None:
+                conn.close()
+            time.sleep(5)
@@ -0,0 +1,49 @@
+import tiempos
+
+
+class Respuesta:
+    # Junta los mensajes de un turno; tiene la misma interfaz message() que MessagingResponse
+    def __init__(self):
+        self.mensajes = []
+
+    def message(self, texto):
+        self.mensajes.append(texto)
+
+
+class TransicionInvalida(Exception):
+    pass
+
+
+class MaquinaEstados:
+    # Estados de la conversación, sus transiciones permitidas y el manejador de cada uno.
+    # Un manejador recibe (turno, mensaje, respuesta) y cambia de estado con turno.cambiar_estado().
+
+    def __init__(self, inicial):
+        self.inicial = inicial
+        self._manejadores = {}
+        self._transiciones = {}
+
+    def estado(self, nombre, transiciones=()):
+        def registrar(manejador):
+            self._manejadores[nombre] = manejador
+            # Quedarse en el mismo estado siempre está permitido
+            self._transiciones[nombre] = frozenset(transiciones) | {nombre}
+            return manejador
+        return registrar
+
+    @property
+    def estados(self):
+        return list(self._manejadores)
+
+    def transiciones(self, estado):
+        return self._transiciones[estado]
+
+    def atender(self, turno, mensaje, respuesta):
+        estado = turno.estado if turno.estado in self._manejadores else self.inicial
+        # Los tiempos del mensaje completo quedan agrupados bajo el estado que lo atendió
+        tiempos.marcar_estado(estado)
+        with tiempos.medir("conversacion.manejador"):
+            self._manejadores[estado](turno, mensaje, respuesta)
+        if turno.estado not in self._transiciones[estado]:
+            raise TransicionInvalida(f"{estado} -> {turno.estado} no está declarada")
+        return estado
@@ -0,0 +1,207 @@
+from cache import Cache
+from carrito import sentencia_sumar_item
+from db import cursor
+from sesiones import Sesion, almacen
+from tiempos import medido
+
+SQL_SESION_Y_CARRITO = """
+    LEFT JOIN LATERAL (
+        SELECT id_sesion, estado, dato_temp FROM sesiones
+        WHERE id_cliente = c.id_cliente AND estado != 'finalizado'
+        ORDER BY id_sesion DESC LIMIT 1
+    ) s ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT id_carrito FROM carritos
+        WHERE id_cliente = c.id_cliente AND estado = 'activo'
+        ORDER BY id_carrito DESC LIMIT 1
+    ) k ON TRUE
+"""
+# Cliente, sesión activa y carrito activo en una sola consulta
+SQL_ESTADO = (
+    "SELECT c.id_cliente, c.nombre, s.id_sesion, s.estado, s.dato_temp, k.id_carrito FROM clientes c"
+    + SQL_SESION_Y_CARRITO + "WHERE c.telefono = %s"
+)
+# Lo mismo cuando el cliente ya está en caché
+SQL_ESTADO_POR_CLIENTE = (
+    "SELECT s.id_sesion, s.estado, s.dato_temp, k.id_carrito FROM (SELECT %s::integer AS id_cliente) c"
+    + SQL_SESION_Y_CARRITO
+)
+
+# telefono -> (id_cliente, nombre). Los teléfonos sin cliente no se guardan.
+clientes_cache = Cache("clientes", maximo=50_000, ttl=3600, guardar_vacios=False)
+
+SQL_CARRITO_ACTIVO = (
+    "(SELECT id_carrito FROM carritos WHERE id_cliente = {cliente} AND estado = 'activo' "
+    "ORDER BY id_carrito DESC LIMIT 1)"
+)
+SQL_CLIENTE_POR_TELEFONO = "(SELECT id_cliente FROM clientes WHERE telefono = %s)"
+
+
+class Turno:
+    # Estado de un cliente durante un mensaje. Los cambios se acumulan y se
+    # escriben todos juntos en guardar(), en un único viaje a la base de datos.
+
+    def __init__(self, telefono):
+        self.telefono = telefono
+        self.id_cliente = None
+        self.nombre = None
+        self.id_sesion = None
+        self.estado = None
+        self.dato_temp = None
+        self.id_carrito = None
+        self._nuevo_cliente = False
+        self._nueva_sesion = False
+        self._nuevo_carrito = False
+        self._sesion_modificada = False
+        self._finalizar = False
+        self._items = {}      # id_producto -> cantidad a sumar al carrito
+
+    @classmethod
+    @medido("turno.cargar")
+    def cargar(cls, telefono):
+        turno = cls(telefono)
+        cliente = clientes_cache.obtener(telefono)
+        if cliente:
+            turno.id_cliente, turno.nombre = cliente
+            sesion = almacen.obtener(turno.id_cliente)
+            if sesion is not None and sesion.id_carrito is not None:
+                # Cliente en caché y sesión en el almacén: el turno no consulta la base
+                turno._tomar_sesion(sesion)
+                return turno
+            with cursor() as cur:
+                cur.execute(SQL_ESTADO_POR_CLIENTE, (turno.id_cliente,))
+                turno.id_sesion, turno.estado, turno.dato_temp, turno.id_carrito = cur.fetchone()
+            turno._combinar_sesion(sesion)
+        else:
+            with cursor() as cur:
+                cur.execute(SQL_ESTADO, (telefono,))
+                fila = cur.fetchone()
+            if not fila:
+                return turno
+            (turno.id_cliente, turno.nombre, turno.id_sesion,
+             turno.estado, turno.dato_temp, turno.id_carrito) = fila
+            clientes_cache.guardar(telefono, (turno.id_cliente, turno.nombre))
+            # El cliente pudo salir de la caché con la conversación en curso
+            turno._combinar_sesion(almacen.obtener(turno.id_cliente))
+        if turno.id_sesion is not None:
+            almacen.recordar(turno.id_cliente, turno._sesion())
+        return turno
+
+    def _tomar_sesion(self, sesion):
+        self.id_sesion, self.estado, self.dato_temp, self.id_carrito = (
+            sesion.id_sesion, sesion.estado, sesion.dato_temp, sesion.id_carrito
+        )
+
+    def _combinar_sesion(self, sesion):
+        # Las transiciones en memoria pueden ser más nuevas que la tabla. Si la tabla tiene
+        # otra sesión, la de memoria quedó vieja y recordar() la reemplaza.
+        if sesion is not None and sesion.id_sesion == self.id_sesion:
+            self.estado, self.dato_temp = sesion.estado, sesion.dato_temp
+
+    def _sesion(self):
+        return Sesion(self.id_sesion, self.estado, self.dato_temp, self.id_carrito)
+
+    @property
+    def existe_cliente(self):
+        return self.id_cliente is not None or self._nuevo_cliente
+
+    @property
+    def tiene_sesion(self):
+        return self.id_sesion is not None
+
+    def crear_cliente(self, nombre, estado="menu"):
+        self.nombre = nombre
+        self._nuevo_cliente = True
+        self.iniciar_sesion(estado)
+
+    def iniciar_sesion(self, estado="menu"):
+        self.estado, self.dato_temp = estado, None
+        self._nueva_sesion = True
+        self._nuevo_carrito = True
+        self.id_carrito = None
+
+    def cambiar_estado(self, estado, dato_temp=None):
+        if (estado, dato_temp) == (self.estado, self.dato_temp):
+            return
+        self.estado, self.dato_temp = estado, dato_temp
+        self._sesion_modificada = True
+
+    def asegurar_carrito(self):
+        if self.id_carrito is None:
+            self._nuevo_carrito = True
+
+    def agregar_item(self, id_producto, cantidad):
+        self.asegurar_carrito()
+        self._items[id_producto] = self._items.get(id_producto, 0) + cantidad
+
+    def finalizar(self):
+        self.estado = "finalizado"
+        self._finalizar = True
+
+    def sentencias(self):
+        if self._nuevo_cliente:
+            cliente_sql, cliente_params = SQL_CLIENTE_POR_TELEFONO, (self.telefono,)
+        else:
+            cliente_sql, cliente_params = "%s", (self.id_cliente,)
+        carrito_sql, carrito_params = SQL_CARRITO_ACTIVO.format(cliente=cliente_sql), cliente_params
+
+        pendientes = []
+        if self._nuevo_cliente:
+            pendientes.append((
+                "INSERT INTO clientes (nombre, telefono) VALUES (%s, %s)",
+                (self.nombre, self.telefono),
+            ))
+        if self._nueva_sesion:
+            pendientes.append((
+                f"INSERT INTO sesiones (id_cliente, estado, dato_temp) VALUES ({cliente_sql}, %s, %s)",
+                cliente_params + (self.estado, self.dato_temp),
+            ))
+        elif self._sesion_modificada and not self._finalizar and not almacen.diferido:
+            pendientes.append((
+                f"UPDATE sesiones SET estado = %s, dato_temp = %s WHERE id_cliente = {cliente_sql} AND estado != 'finalizado'",
+                (self.estado, self.dato_temp) + cliente_params,
+            ))
+        if self._nuevo_carrito:
+            pendientes.append((
+                f"INSERT INTO carritos (id_cliente, estado) VALUES ({cliente_sql}, 'activo')",
+                cliente_params,
+            ))
+        for id_producto, cantidad in self._items.items():
+            if self.id_carrito is not None and not self._nuevo_carrito:
+                pendientes.append(sentencia_sumar_item("%s", (self.id_carrito,), id_producto, cantidad))
+            else:
+                # Carrito recién creado en este lote: no puede tener el producto todavía
+                pendientes.append((
+                    f"INSERT INTO carrito_items (id_carrito, id_producto, cantidad) VALUES ({carrito_sql}, %s, %s)",
+                    carrito_params + (id_producto, cantidad),
+                ))
+        if self._finalizar:
+            pendientes.append((
+                f"UPDATE sesiones SET estado = 'finalizado' WHERE id_cliente = {cliente_sql}",
+                cliente_params,
+            ))
+        return pendientes
+
+    @medido("turno.guardar")
+    def guardar(self):
+        pendientes = self.sentencias()
+        if pendientes:
+            with cursor() as cur:
+                # Un solo execute con todas las sentencias: un viaje de ida y vuelta
+                lote = b";\n".join(cur.mogrify(sql, params) for sql, params in pendientes)
+                cur.execute(lote)
+        if self._nuevo_cliente:
+            clientes_cache.invalidar(self.telefono)
+        elif self._nueva_sesion or self._finalizar:
+            # El id de la sesión nueva no se conoce aún: el próximo turno la lee de la tabla
+            almacen.olvidar(self.id_cliente)
+        elif self.id_sesion is not None:
+            if self._nuevo_carrito:
+                self.id_carrito = None
+            if self._sesion_modificada:
+                almacen.modificar(self.id_cliente, self._sesion())
+            elif self._nuevo_carrito:
+                almacen.recordar(self.id_cliente, self._sesion())
+        self._nuevo_cliente = self._nueva_sesion = self._nuevo_carrito = False
+        self._sesion_modificada = self._finalizar = False
+        self._items = {}
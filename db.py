@@ -0,0 +1,296 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from tiempos import medir
+
+# psycopg2 se importa al abrir la primera conexión, no al importar el módulo (ver arranque.py).
+# Todo lo que lo usa más abajo corre con una conexión ya abierta.
+psycopg2 = None
+CursorContado = None
+
+# Tamaño del pool por worker de gunicorn. El total de conexiones hacia
+# Postgres es DB_POOL_MAX * número de workers. DB_POOL_MIN conexiones se abren
+# al levantar cada worker (post_fork) y nunca se cierran por inactividad.
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
+# Segundos que una petición espera por una conexión libre antes de fallar
+DB_POOL_ESPERA = float(os.getenv("DB_POOL_ESPERA", "5"))
+# Conexiones inactivas más de este tiempo se verifican con SELECT 1 antes de usarlas
+DB_POOL_VERIFICAR = float(os.getenv("DB_POOL_VERIFICAR", "30"))
+# Conexiones sobre el mínimo que llevan este tiempo inactivas se cierran
+DB_POOL_INACTIVA = float(os.getenv("DB_POOL_INACTIVA", "300"))
+
+
+class PoolAgotado(Exception):
+    pass
+
+
+def importar_psycopg2():
+    global psycopg2, CursorContado
+    if psycopg2 is not None:
+        return psycopg2
+    import psycopg2 as modulo
+    from psycopg2 import extensions
+
+    class CursorContado(extensions.cursor):
+        # Cuenta los viajes de ida y vuelta a Postgres hechos por el hilo actual
+        def execute(self, query, vars=None):
+            # psycopg2 envía un BEGIN aparte antes de la primera sentencia de cada transacción
+            if not self.connection.autocommit and self.connection.status == extensions.STATUS_READY:
+                _sumar_viajes(2)
+            else:
+                _sumar_viajes(1)
+            with medir("db.sentencia"):
+                return super().execute(query, vars)
+
+    psycopg2 = modulo
+    return psycopg2
+
+
+def conectar_db():
+    importar_psycopg2()
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        database=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        cursor_factory=CursorContado,
+    )
+
+
+class PoolConexiones:
+    def __init__(self, minimo=DB_POOL_MIN, maximo=DB_POOL_MAX, espera=DB_POOL_ESPERA,
+                 verificar=DB_POOL_VERIFICAR, inactiva=DB_POOL_INACTIVA):
+        self.pid = os.getpid()
+        self.minimo = minimo
+        self.maximo = maximo
+        self.espera = espera
+        self.verificar = verificar
+        self.inactiva = inactiva
+        self._cupos = threading.BoundedSemaphore(maximo)
+        self._lock = threading.Lock()
+        self._libres = []  # (conexion, instante del último uso)
+        self._abiertas = 0
+        self._en_uso = 0
+        self._solicitudes = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+        self._agotado = 0
+        self._creadas = 0
+        self._descartadas = 0
+
+    def calentar(self):
+        # Se piden todas juntas; pedir y devolver de a una reusaría siempre la misma
+        conexiones = []
+        try:
+            for _ in range(self.minimo):
+                conexiones.append(self.obtener())
+        finally:
+            for conn in conexiones:
+                self.devolver(conn)
+
+    def obtener(self):
+        inicio = time.monotonic()
+        if not self._cupos.acquire(timeout=self.espera):
+            with self._lock:
+                self._agotado += 1
+            raise PoolAgotado(f"Sin conexiones libres tras {self.espera}s (máximo {self.maximo})")
+        espera = time.monotonic() - inicio
+        try:
+            conn = self._conexion_sana()
+        except Exception:
+            self._cupos.release()
+            raise
+        with self._lock:
+            self._en_uso += 1
+            self._solicitudes += 1
+            self._espera_total += espera
+            self._espera_max = max(self._espera_max, espera)
+        return conn
+
+    def devolver(self, conn, descartar=False):
+        ahora = time.monotonic()
+        if not descartar and not conn.closed:
+            try:
+                if conn.status != psycopg2.extensions.STATUS_READY:
+                    conn.rollback()
+            except psycopg2.Error:
+                descartar = True
+        cerrar = []
+        with self._lock:
+            self._en_uso -= 1
+            if descartar or conn.closed:
+                self._abiertas -= 1
+                self._descartadas += 1
+                cerrar.append(conn)
+            else:
+                self._libres.append((conn, ahora))
+            # Cerramos las conexiones que sobran sobre el mínimo y llevan rato sin usarse
+            while self._abiertas > self.minimo and self._libres and ahora - self._libres[0][1] > self.inactiva:
+                cerrar.append(self._libres.pop(0)[0])
+                self._abiertas -= 1
+        self._cupos.release()
+        for c in cerrar:
+            _cerrar_silencioso(c)
+
+    def cerrar(self):
+        with self._lock:
+            libres, self._libres = self._libres, []
+            self._abiertas -= len(libres)
+        for conn, _ in libres:
+            _cerrar_silencioso(conn)
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "pid": self.pid,
+                "minimo": self.minimo,
+                "maximo": self.maximo,
+                "abiertas": self._abiertas,
+                "en_uso": self._en_uso,
+                "libres": len(self._libres),
+                "solicitudes": self._solicitudes,
+                "espera_promedio_ms": round(1000 * self._espera_total / self._solicitudes, 3) if self._solicitudes else 0.0,
+                "espera_max_ms": round(1000 * self._espera_max, 3),
+                "agotado": self._agotado,
+                "creadas": self._creadas,
+                "descartadas": self._descartadas,
+            }
+
+    def _conexion_sana(self):
+        while True:
+            with self._lock:
+                if not self._libres:
+                    break
+                conn, ultimo_uso = self._libres.pop()
+            if not conn.closed and (time.monotonic() - ultimo_uso < self.verificar or _responde(conn)):
+                return conn
+            _cerrar_silencioso(conn)
+            with self._lock:
+                self._abiertas -= 1
+                self._descartadas += 1
+
+        with medir("db.conectar"):
+            conn = conectar_db()
+        with self._lock:
+            self._abiertas += 1
+            self._creadas += 1
+        return conn
+
+
+def _responde(conn):
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _cerrar_silencioso(conn):
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def obtener_pool():
+    global _pool
+    # Tras un fork (gunicorn) el pool heredado pertenece al proceso padre
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = PoolConexiones()
+    return _pool
+
+
+def reiniciar_pool():
+    # No cerramos las conexiones heredadas: sus sockets siguen siendo del proceso padre
+    global _pool
+    with _pool_lock:
+        _pool = None
+    _local.__dict__.clear()
+
+
+def cerrar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.cerrar()
+        _pool = None
+
+
+def _sumar_viajes(n):
+    _local.viajes = getattr(_local, "viajes", 0) + n
+
+
+def viajes():
+    return getattr(_local, "viajes", 0)
+
+
+def metricas():
+    pool = _pool
+    if pool is None or pool.pid != os.getpid():
+        return {"pid": os.getpid(), "abiertas": 0, "en_uso": 0, "libres": 0, "solicitudes": 0}
+    return pool.metricas()
+
+
+@contextmanager
+def transaccion():
+    # Todas las funciones de acceso a datos llamadas dentro del bloque comparten
+    # la misma conexión y se confirman juntas al salir.
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+
+    pool = obtener_pool()
+    with medir("db.obtener_conexion"):
+        conn = pool.obtener()
+    _local.conn = conn
+    descartar = False
+    try:
+        yield conn
+        if conn.status != psycopg2.extensions.STATUS_READY:
+            _sumar_viajes(1)
+        with medir("db.commit"):
+            conn.commit()
+    except BaseException:
+        try:
+            if conn.status != psycopg2.extensions.STATUS_READY:
+                _sumar_viajes(1)
+            conn.rollback()
+        except psycopg2.Error:
+            descartar = True
+        raise
+    finally:
+        _local.conn = None
+        pool.devolver(conn, descartar=descartar)
+
+
+@contextmanager
+def cursor():
+    with transaccion() as conn:
+        cur = conn.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+
+def en_transaccion(funcion):
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        with transaccion():
+            return funcion(*args, **kwargs)
+    return envoltura
@@ -0,0 +1,49 @@
+import logging
+import os
+
+import arranque
+import catalogo
+import db
+import sesiones
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+# El master importa la app una vez y los workers la heredan (ver arranque.py)
+preload_app = arranque.GUNICORN_PRELOAD
+
+
+def when_ready(server):
+    # Corre en el master antes de crear los workers; con preload_app la app ya está importada
+    if preload_app:
+        arranque.precargar()
+        server.log.info(f"Precarga lista: {arranque.resumen()}")
+
+
+def post_fork(server, worker):
+    # Cada worker arma su propio pool; las conexiones del master no se comparten
+    db.reiniciar_pool()
+    arranque.marcar_fork()
+    # Abre DB_POOL_MIN conexiones antes de la primera petición
+    try:
+        db.obtener_pool().calentar()
+    except Exception as e:
+        # Sin base el worker igual levanta; el pool reintenta en cada petición
+        server.log.warning(f"No se pudo precalentar el pool de conexiones: {e}")
+    catalogo.escuchar_cambios()
+
+
+def post_worker_init(worker):
+    # Los logs de los módulos de la app (hilos de sesiones, catálogo) van al log de errores de gunicorn
+    raiz = logging.getLogger()
+    raiz.handlers = worker.log.error_log.handlers
+    raiz.setLevel(worker.log.error_log.level)
+    arranque.worker_listo()
+    worker.log.info(f"Worker listo: {arranque.resumen()}")
+
+
+def worker_exit(server, worker):
+    # Las transiciones que aún están solo en memoria se escriben antes de salir
+    sesiones.almacen.volcar()
+    db.cerrar_pool()
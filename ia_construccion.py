@@ -1,14 +1,113 @@
-from transformers import pipeline
+import os
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FuturoExpirado
 
-# Cargar un modelo liviano en español (puedes probar otros más grandes si tienes GPU o paciencia)
-chat = pipeline("text-generation", model="dbmdz/gpt2-spanish", max_length=150)
+from tiempos import medir, medido
 
-def responder_consulta_construccion(pregunta_usuario):
+# El modelo se carga recién en la primera consulta, no al importar el módulo.
+# En producción corre solo dentro del worker de celery de la cola "ia" (ver tareas.py),
+# así cada host mantiene una única copia de GPT-2 en memoria.
+IA_MODELO = os.getenv("IA_MODELO", "dbmdz/gpt2-spanish")
+IA_LOTE_MAX = int(os.getenv("IA_LOTE_MAX", "8"))
+# Segundos que se espera a que lleguen más consultas antes de generar el lote
+IA_LOTE_ESPERA = float(os.getenv("IA_LOTE_ESPERA", "0.05"))
+IA_TIMEOUT = float(os.getenv("IA_TIMEOUT", "30"))
+
+
+def es_consulta_construccion(mensaje):
+    mensaje = mensaje.lower()
+    palabras_clave = [
+        "radier", "cemento", "arena", "ripio", "hacer mezcla",
+        "cuánto necesito", "cuantos sacos", "materiales", "hormigón",
+        "cuanto cemento", "cuanto material", "mezcla radier",
+        "hormigon", "mortero", "concreto"
+    ]
+    return any(p in mensaje for p in palabras_clave)
+
+
+class ConsultaExpirada(Exception):
+    pass
+
+
+class ServicioInferencia:
+    def __init__(self, modelo=IA_MODELO, lote_max=IA_LOTE_MAX, lote_espera=IA_LOTE_ESPERA, timeout=IA_TIMEOUT):
+        self.modelo = modelo
+        self.lote_max = lote_max
+        self.lote_espera = lote_espera
+        self.timeout = timeout
+        self._chat = None
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    def cargar(self):
+        with self._lock:
+            if self._chat is None:
+                from transformers import pipeline
+                chat = pipeline("text-generation", model=self.modelo, max_length=150)
+                # GPT-2 no trae token de relleno; sin él no se pueden generar lotes
+                if chat.tokenizer.pad_token is None:
+                    chat.tokenizer.pad_token = chat.tokenizer.eos_token
+                chat.tokenizer.padding_side = "left"
+                self._chat = chat
+        return self._chat
+
+    def generar(self, prompt, timeout=None):
+        self._arrancar()
+        futuro = Future()
+        self._cola.put((prompt, futuro))
+        try:
+            return futuro.result(timeout=timeout or self.timeout)
+        except FuturoExpirado:
+            # Si todavía no entró a un lote, el hilo lo descarta
+            futuro.cancel()
+            raise ConsultaExpirada(f"Sin respuesta del modelo tras {timeout or self.timeout}s")
+
+    def _arrancar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            with self._lock:
+                if self._hilo is None or not self._hilo.is_alive():
+                    self._hilo = threading.Thread(target=self._procesar, name="inferencia", daemon=True)
+                    self._hilo.start()
+
+    def _siguiente_lote(self):
+        lote = [self._cola.get()]
+        while len(lote) < self.lote_max:
+            try:
+                lote.append(self._cola.get(timeout=self.lote_espera))
+            except queue.Empty:
+                break
+        return [(p, f) for p, f in lote if f.set_running_or_notify_cancel()]
+
+    def _procesar(self):
+        while True:
+            lote = self._siguiente_lote()
+            if not lote:
+                continue
+            try:
+                with medir("ia.cargar_modelo"):
+                    chat = self.cargar()
+                with medir("ia.generar_lote"):
+                    resultados = chat([p for p, _ in lote], batch_size=len(lote))
+            except Exception as e:
+                for _, futuro in lote:
+                    futuro.set_exception(e)
+                continue
+            for (_, futuro), resultado in zip(lote, resultados):
+                futuro.set_result(resultado[0]["generated_text"])
+
+
+servicio = ServicioInferencia()
+
+
+@medido("ia.responder")
+def responder_consulta_construccion(pregunta_usuario, timeout=None):
     prompt = (
         "Eres un experto en ferretería y construcción en Chile. "
         "Ayuda al usuario a calcular materiales como cemento, arena y ripio para proyectos de construcción. "
         "Ejemplo: 'Necesito hacer un radier de 30 m²'\n\n"
         f"Usuario: {pregunta_usuario}\nAsistente:"
     )
-    respuesta = chat(prompt)[0]['generated_text']
+    respuesta = servicio.generar(prompt, timeout=timeout)
     return respuesta.split("Asistente:")[-1].strip()
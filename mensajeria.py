@@ -0,0 +1,34 @@
+import os
+from collections import deque
+
+from tiempos import medido
+
+# Número de WhatsApp de Twilio desde el que se envían los mensajes, ej. "whatsapp:+14155238886"
+TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM")
+# En modo local no se llama a Twilio: los mensajes quedan en `enviados` y se imprimen
+MODO_LOCAL = os.getenv("MODO_LOCAL") == "1"
+
+enviados = deque(maxlen=1000)
+_cliente = None
+
+
+def cliente_twilio():
+    global _cliente
+    if _cliente is None:
+        # twilio.rest arrastra aiohttp y requests; solo lo importa quien envía mensajes
+        from twilio.rest import Client
+        _cliente = Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
+    return _cliente
+
+
+@medido("twilio.enviar")
+def enviar_whatsapp(telefono, texto):
+    if MODO_LOCAL:
+        enviados.append((telefono, texto))
+        print(f"📤 {telefono}: {texto}")
+        return None
+    return cliente_twilio().messages.create(
+        from_=TWILIO_WHATSAPP_FROM,
+        to=f"whatsapp:{telefono}",
+        body=texto,
+    )
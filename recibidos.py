@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+import time
+
+import db
+from cache import CACHE_REDIS_URL, CacheLocal
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+log = logging.getLogger(__name__)
+
+# MessageSid ya atendidos: Twilio reintenta los webhooks que tardan en responder y el reintento
+# puede caer en cualquier worker o host, así que el registro tiene que ser compartido.
+# "db":      tabla con el MessageSid como clave primaria, dentro de la transacción del mensaje:
+#            si el procesamiento falla el sid se va con el rollback. La tabla se crea sola.
+# "redis":   SET NX con vencimiento (RECIBIDOS_REDIS_URL, por defecto CACHE_REDIS_URL).
+# "memoria": solo dentro del proceso; alcanza con un único worker o con las colas por teléfono.
+# Si el registro compartido no está disponible se avisa en el log y se usa el de memoria.
+RECIBIDOS_BACKEND = os.getenv("RECIBIDOS_BACKEND", "redis" if CACHE_REDIS_URL else "db")
+RECIBIDOS_REDIS_URL = os.getenv("RECIBIDOS_REDIS_URL", CACHE_REDIS_URL or "redis://localhost:6379/0")
+# Twilio deja de reintentar mucho antes; pasado este tiempo el sid se olvida (segundos)
+RECIBIDOS_TTL = int(os.getenv("RECIBIDOS_TTL", "86400"))
+# Cada cuántos mensajes recibidos un proceso borra de la tabla los sids vencidos
+RECIBIDOS_LIMPIEZA = 1000
+# Sin la tabla (sin permisos para crearla, base caída) se vuelve a intentar crearla cada tanto (segundos)
+RECIBIDOS_REINTENTO = 60
+
+SQL_TABLA_RECIBIDOS = """
+    CREATE TABLE IF NOT EXISTS mensajes_recibidos (
+        message_sid TEXT PRIMARY KEY,
+        recibido TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+# Si otro proceso tiene el mismo sid sin confirmar, espera a que termine
+SQL_AGREGAR = "INSERT INTO mensajes_recibidos (message_sid) VALUES (%s) ON CONFLICT DO NOTHING"
+SQL_VENCER = "DELETE FROM mensajes_recibidos WHERE recibido < now() - make_interval(secs => %s)"
+
+
+class RecibidosMemoria:
+    def __init__(self, ttl=RECIBIDOS_TTL):
+        self._cache = CacheLocal(100_000, ttl)
+
+    def agregar(self, sid):
+        return self._cache.agregar(sid, True)
+
+    def quitar(self, sid):
+        self._cache.invalidar(sid)
+
+
+class RecibidosRedis:
+    PREFIJO = "recibido:"
+
+    def __init__(self, url=RECIBIDOS_REDIS_URL, ttl=RECIBIDOS_TTL):
+        self._redis = redis.Redis.from_url(url) if redis is not None else None
+        self.ttl = ttl
+        self._respaldo = RecibidosMemoria(ttl)
+        if self._redis is None:
+            log.warning("RECIBIDOS_BACKEND=redis requiere el paquete redis; los MessageSid se registran en memoria")
+
+    def agregar(self, sid):
+        if self._redis is None:
+            return self._respaldo.agregar(sid)
+        try:
+            return bool(self._redis.set(self.PREFIJO + sid, 1, nx=True, ex=self.ttl))
+        except redis.RedisError:
+            log.exception("No se pudo registrar el MessageSid en Redis; se usa el registro en memoria")
+            return self._respaldo.agregar(sid)
+
+    def quitar(self, sid):
+        self._respaldo.quitar(sid)
+        if self._redis is None:
+            return
+        try:
+            self._redis.delete(self.PREFIJO + sid)
+        except redis.RedisError:
+            log.exception("No se pudo quitar el MessageSid de Redis")
+
+
+class RecibidosBD:
+    def __init__(self, ttl=RECIBIDOS_TTL):
+        self.ttl = ttl
+        self._lista = False
+        self._reintento = 0.0
+        self._respaldo = RecibidosMemoria(ttl)
+        self._agregados = 0
+        self._lock = threading.Lock()
+
+    def agregar(self, sid):
+        # Se llama dentro de la transacción del mensaje: un viaje más, sin conexión ni COMMIT propios
+        if not self._preparar():
+            return self._respaldo.agregar(sid)
+        with db.cursor() as cur:
+            cur.execute(SQL_AGREGAR, (sid,))
+            nuevo = cur.rowcount == 1
+            if nuevo and self._toca_limpiar():
+                cur.execute(SQL_VENCER, (self.ttl,))
+        return nuevo
+
+    def quitar(self, sid):
+        # De la tabla ya lo sacó el rollback de la transacción del mensaje
+        self._respaldo.quitar(sid)
+
+    def _preparar(self):
+        # La tabla se crea una vez por proceso con una conexión aparte: si falla no deja
+        # abortada la transacción del mensaje
+        if self._lista or time.monotonic() < self._reintento:
+            return self._lista
+        with self._lock:
+            if self._lista or time.monotonic() < self._reintento:
+                return self._lista
+            conn = None
+            try:
+                conn = db.conectar_db()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(SQL_TABLA_RECIBIDOS)
+                self._lista = True
+            except Exception:
+                log.exception("No se pudo preparar la tabla mensajes_recibidos; los MessageSid se registran en memoria")
+                self._reintento = time.monotonic() + RECIBIDOS_REINTENTO
+            finally:
+                if conn is not None:
+                    conn.close()
+        return self._lista
+
+    def _toca_limpiar(self):
+        with self._lock:
+            self._agregados += 1
+            return self._agregados % RECIBIDOS_LIMPIEZA == 0
+
+
+def crear_registro(backend=RECIBIDOS_BACKEND):
+    if backend == "memoria":
+        return RecibidosMemoria()
+    if backend == "redis":
+        return RecibidosRedis()
+    return RecibidosBD()
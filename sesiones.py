@@ -0,0 +1,263 @@
+import logging
+import os
+import pickle
+import threading
+import time
+
+import db
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+log = logging.getLogger(__name__)
+
+# "db": cada transición se escribe en sesiones dentro del mismo turno (diseño original).
+# "memoria": estado en el proceso y escritura diferida; requiere que los mensajes de un
+#            teléfono lleguen siempre al mismo proceso (un worker, o las colas por teléfono de celery).
+# "redis": como "memoria" pero compartido entre workers y hosts.
+SESIONES_BACKEND = os.getenv("SESIONES_BACKEND", "db")
+SESIONES_REDIS_URL = os.getenv("SESIONES_REDIS_URL", "redis://localhost:6379/0")
+# Cada cuánto se vuelcan a la tabla sesiones las transiciones pendientes (segundos)
+SESIONES_ESCRITURA = float(os.getenv("SESIONES_ESCRITURA", "1"))
+# Sesiones sin mensajes por más de este tiempo se sacan de memoria (siguen en la tabla)
+SESIONES_INACTIVA = float(os.getenv("SESIONES_INACTIVA", "1800"))
+
+SQL_VOLCAR = """
+    UPDATE sesiones s SET estado = v.estado, dato_temp = v.dato_temp
+    FROM (VALUES %s) AS v(id_sesion, estado, dato_temp)
+    WHERE s.id_sesion = v.id_sesion AND s.estado != 'finalizado'
+"""
+
+
+class Sesion:
+    __slots__ = ("id_sesion", "estado", "dato_temp", "id_carrito", "usada")
+
+    def __init__(self, id_sesion, estado, dato_temp, id_carrito=None):
+        self.id_sesion = id_sesion
+        self.estado = estado
+        self.dato_temp = dato_temp
+        self.id_carrito = id_carrito
+        self.usada = time.monotonic()
+
+
+class AlmacenBD:
+    # Sin memoria propia: el turno lee la sesión de la tabla y escribe cada cambio en su lote
+    diferido = False
+
+    def obtener(self, id_cliente):
+        return None
+
+    def recordar(self, id_cliente, sesion):
+        pass
+
+    def modificar(self, id_cliente, sesion):
+        pass
+
+    def olvidar(self, id_cliente):
+        pass
+
+    def volcar(self):
+        return 0
+
+    def metricas(self):
+        return {"backend": "db"}
+
+
+class AlmacenDiferido:
+    # Base de los almacenes con escritura diferida: un hilo por proceso vuelca las transiciones
+    # cada `escritura` segundos. Tras un fork se crea uno nuevo.
+    diferido = True
+    automatico = True
+
+    def mantener(self):
+        self.volcar()
+
+    def _arrancar(self):
+        if self.automatico and self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._escribir, name="sesiones", daemon=True).start()
+
+    def _escribir(self):
+        while True:
+            time.sleep(self.escritura)
+            try:
+                self.mantener()
+            except Exception:
+                log.exception("No se pudieron volcar las sesiones")
+
+
+class AlmacenMemoria(AlmacenDiferido):
+    def __init__(self, escritura=SESIONES_ESCRITURA, inactiva=SESIONES_INACTIVA, automatico=True):
+        self.escritura = escritura
+        self.inactiva = inactiva
+        # Sin escritura automática quien use el almacén debe llamar a volcar()
+        self.automatico = automatico
+        self._sesiones = {}       # id_cliente -> Sesion
+        self._sucias = set()      # id_cliente con transiciones sin volcar
+        self._lock = threading.Lock()
+        self._pid = None
+        self.volcadas = 0
+        self.vencidas = 0
+
+    def obtener(self, id_cliente):
+        with self._lock:
+            sesion = self._sesiones.get(id_cliente)
+            if sesion is not None:
+                sesion.usada = time.monotonic()
+            return sesion
+
+    def recordar(self, id_cliente, sesion):
+        # Lo leído de la tabla no pisa transiciones de la misma sesión que aún no se vuelcan
+        with self._lock:
+            actual = self._sesiones.get(id_cliente)
+            if actual is not None and id_cliente in self._sucias and actual.id_sesion == sesion.id_sesion:
+                actual.id_carrito = sesion.id_carrito
+                actual.usada = time.monotonic()
+            else:
+                self._sesiones[id_cliente] = sesion
+                self._sucias.discard(id_cliente)
+        self._arrancar()
+
+    def modificar(self, id_cliente, sesion):
+        sesion.usada = time.monotonic()
+        with self._lock:
+            self._sesiones[id_cliente] = sesion
+            self._sucias.add(id_cliente)
+        self._arrancar()
+
+    def olvidar(self, id_cliente):
+        # La sesión se cerró o se reemplazó en la base; sus cambios pendientes ya no aplican
+        with self._lock:
+            self._sesiones.pop(id_cliente, None)
+            self._sucias.discard(id_cliente)
+
+    def volcar(self):
+        with self._lock:
+            filas = [
+                (s.id_sesion, s.estado, s.dato_temp)
+                for s in (self._sesiones.get(i) for i in self._sucias) if s is not None
+            ]
+            sucias, self._sucias = self._sucias, set()
+        if not filas:
+            return 0
+        try:
+            from psycopg2.extras import execute_values
+
+            with db.cursor() as cur:
+                execute_values(cur, SQL_VOLCAR, filas)
+        except Exception:
+            # Se reintenta en el próximo ciclo salvo que haya transiciones más nuevas
+            with self._lock:
+                self._sucias |= {i for i in sucias if i in self._sesiones}
+            raise
+        self.volcadas += len(filas)
+        return len(filas)
+
+    def vencer(self):
+        limite = time.monotonic() - self.inactiva
+        with self._lock:
+            viejas = [i for i, s in self._sesiones.items() if s.usada < limite and i not in self._sucias]
+            for i in viejas:
+                del self._sesiones[i]
+        self.vencidas += len(viejas)
+        return len(viejas)
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "backend": "memoria",
+                "sesiones": len(self._sesiones),
+                "pendientes": len(self._sucias),
+                "volcadas": self.volcadas,
+                "vencidas": self.vencidas,
+            }
+
+    def mantener(self):
+        self.volcar()
+        self.vencer()
+
+
+class AlmacenRedis(AlmacenDiferido):
+    PREFIJO = "sesion:"
+    SUCIAS = "sesiones:sucias"
+
+    def __init__(self, url=SESIONES_REDIS_URL, escritura=SESIONES_ESCRITURA, inactiva=SESIONES_INACTIVA):
+        if redis is None:
+            raise RuntimeError("SESIONES_BACKEND=redis requiere el paquete redis")
+        self._redis = redis.Redis.from_url(url)
+        self.escritura = escritura
+        self.inactiva = int(inactiva)
+        self._pid = None
+        self._lock = threading.Lock()
+        self.volcadas = 0
+
+    def _clave(self, id_cliente):
+        return f"{self.PREFIJO}{id_cliente}"
+
+    def obtener(self, id_cliente):
+        datos = self._redis.get(self._clave(id_cliente))
+        if datos is None:
+            return None
+        self._redis.expire(self._clave(id_cliente), self.inactiva)
+        return Sesion(*pickle.loads(datos))
+
+    def recordar(self, id_cliente, sesion):
+        # Lo leído de la tabla no pisa transiciones de la misma sesión que aún no se vuelcan
+        if self._redis.sismember(self.SUCIAS, id_cliente):
+            actual = self.obtener(id_cliente)
+            if actual is not None and actual.id_sesion == sesion.id_sesion:
+                sesion = Sesion(actual.id_sesion, actual.estado, actual.dato_temp, sesion.id_carrito)
+        valor = pickle.dumps((sesion.id_sesion, sesion.estado, sesion.dato_temp, sesion.id_carrito))
+        self._redis.set(self._clave(id_cliente), valor, ex=self.inactiva)
+        self._arrancar()
+
+    def modificar(self, id_cliente, sesion):
+        valor = pickle.dumps((sesion.id_sesion, sesion.estado, sesion.dato_temp, sesion.id_carrito))
+        with self._redis.pipeline() as p:
+            p.set(self._clave(id_cliente), valor, ex=self.inactiva)
+            p.sadd(self.SUCIAS, id_cliente)
+            p.execute()
+        self._arrancar()
+
+    def olvidar(self, id_cliente):
+        with self._redis.pipeline() as p:
+            p.delete(self._clave(id_cliente))
+            p.srem(self.SUCIAS, id_cliente)
+            p.execute()
+
+    def volcar(self):
+        # Cualquier proceso puede volcar; SPOP reparte las sesiones sin repetirlas
+        ids = self._redis.spop(self.SUCIAS, 1000) or []
+        if not ids:
+            return 0
+        valores = self._redis.mget([self._clave(int(i)) for i in ids])
+        filas = [pickle.loads(v)[:3] for v in valores if v is not None]
+        if filas:
+            try:
+                from psycopg2.extras import execute_values
+
+                with db.cursor() as cur:
+                    execute_values(cur, SQL_VOLCAR, filas)
+            except Exception:
+                self._redis.sadd(self.SUCIAS, *ids)
+                raise
+        self.volcadas += len(filas)
+        return len(filas)
+
+    def metricas(self):
+        return {"backend": "redis", "pendientes": self._redis.scard(self.SUCIAS), "volcadas": self.volcadas}
+
+
+def crear_almacen(backend=SESIONES_BACKEND):
+    if backend == "memoria":
+        return AlmacenMemoria()
+    if backend == "redis":
+        return AlmacenRedis()
+    return AlmacenBD()
+
+
+almacen = crear_almacen()
@@ -0,0 +1,78 @@
+import os
+import zlib
+
+from celery import Celery
+from celery.signals import worker_process_init
+
+import catalogo
+import tiempos
+
+from ia_construccion import ConsultaExpirada, responder_consulta_construccion
+from mensajeria import enviar_whatsapp
+
+# En modo local las tareas corren en el mismo proceso, sin broker ni workers
+MODO_LOCAL = os.getenv("MODO_LOCAL") == "1"
+# Los mensajes de un teléfono siempre caen en la misma cola mensajes.N. Cada cola debe tener
+# un único worker con concurrencia 1 para que se atiendan en orden:
+#   celery -A tareas worker -Q mensajes.0 -c 1 -n mensajes0@%h
+#   ...
+# Worker de inferencia, un proceso por host con hilos para que las consultas se agrupen en lotes:
+#   celery -A tareas worker -Q ia -P threads -c 8
+MENSAJES_PARTICIONES = int(os.getenv("MENSAJES_PARTICIONES", "4"))
+
+celery_app = Celery(
+    "ferrelectrik",
+    broker="memory://" if MODO_LOCAL else os.getenv("CELERY_BROKER_URL", "amqp://guest@localhost//"),
+)
+celery_app.conf.task_routes = {"tareas.responder_construccion": {"queue": "ia"}}
+celery_app.conf.task_always_eager = MODO_LOCAL or os.getenv("CELERY_EAGER") == "1"
+celery_app.conf.task_eager_propagates = True
+# Un mensaje a la vez por worker, así no se adelantan mensajes del mismo teléfono
+celery_app.conf.worker_prefetch_multiplier = 1
+
+
+@worker_process_init.connect
+def iniciar_proceso(**kwargs):
+    # Cada proceso de celery atiende mensajes como un worker de gunicorn (ver gunicorn.conf.py
+    # post_fork): escucha los cambios del catálogo para no servir precios ni productos viejos
+    catalogo.escuchar_cambios()
+
+
+def cola_mensajes(telefono):
+    return f"mensajes.{zlib.crc32(telefono.encode()) % MENSAJES_PARTICIONES}"
+
+
+def encolar_mensaje(telefono, mensaje, sid=None):
+    procesar_whatsapp.apply_async((telefono, mensaje, sid), queue=cola_mensajes(telefono))
+
+
+@celery_app.task(name="tareas.procesar_whatsapp")
+def procesar_whatsapp(telefono, mensaje, sid=None):
+    # app importa este módulo para encolar, por eso se importa aquí
+    from app import procesar_mensaje
+
+    with tiempos.peticion("tarea.procesar_whatsapp"):
+        try:
+            mensajes = procesar_mensaje(telefono, mensaje, sid)
+        except Exception:
+            enviar_whatsapp(telefono, "⚠️ Tuvimos un problema procesando tu mensaje. Intenta de nuevo en un momento.")
+            raise
+        for texto in mensajes:
+            enviar_whatsapp(telefono, texto)
+
+
+@celery_app.task(name="tareas.responder_construccion")
+def responder_construccion(telefono, mensaje):
+    with tiempos.peticion("tarea.responder_construccion"):
+        # Solo se encola desde el menú
+        tiempos.marcar_estado("menu")
+        try:
+            resultado = responder_consulta_construccion(mensaje)
+        except ConsultaExpirada:
+            enviar_whatsapp(telefono, "⌛ No alcancé a calcular tu consulta. Intenta de nuevo en unos minutos.")
+            return
+        enviar_whatsapp(
+            telefono,
+            f"📐 Aquí tienes una recomendación:\n\n{resultado}\n\n"
+            "¿Deseas agregar alguno de estos productos al carrito? 🛒"
+        )
@@ -0,0 +1,87 @@
+import pytest
+
+from buscador import IndiceProductos, palabras, raiz
+
+
+@pytest.fixture
+def indice():
+    indice = IndiceProductos()
+    for id_producto, nombre in [
+        (1, "Saco de cemento 25 kg"),
+        (2, "Cemento blanco"),
+        (3, "Adaptador PVC 1/2"),
+        (4, "Llave de paso 1/2"),
+        (5, "Tubo PVC 20 mm"),
+        (6, "Luz LED panel"),
+        (7, "Codo PVC 1/2"),
+    ]:
+        indice.indexar(id_producto, nombre, "unidad")
+    return indice
+
+
+@pytest.mark.parametrize("plural, singular", [
+    ("sacos", "saco"),
+    ("adaptadores", "adaptador"),
+    ("luces", "luz"),
+    ("tubos", "tubo"),
+])
+def test_plural_y_singular_tienen_la_misma_raiz(plural, singular):
+    assert raiz(plural) == raiz(singular)
+
+
+def test_palabras_normaliza_tildes_y_medidas():
+    assert palabras("Cañería 1/2 Tubos") == ["caneria", "1/2", "tubo"]
+
+
+def test_plural_encuentra_el_singular(indice):
+    assert indice.buscar("sacos")[0] == [1]
+    assert indice.buscar("adaptadores pvc")[0] == [3]
+
+
+def test_error_de_tipeo(indice):
+    assert indice.buscar("cemeto") == ([2, 1], 2)
+    assert indice.buscar("adaptdor")[0] == [3]
+
+
+def test_prefijo(indice):
+    assert indice.buscar("adap")[0] == [3]
+
+
+def test_ranking_prefiere_mas_palabras_y_nombres_cortos(indice):
+    # Todos los que tienen "cemento": primero el nombre más corto
+    assert indice.buscar("cemento")[0] == [2, 1]
+    # "saco cemento" solo lo tiene completo el 1
+    assert indice.buscar("saco cemento")[0][0] == 1
+    # Sin producto con todas las palabras se muestran los que tienen más
+    ids, total = indice.buscar("codo pvc cemento")
+    assert ids[0] == 7 and total >= 1
+
+
+def test_paginacion(indice):
+    todos, total = indice.buscar("1/2", limite=10)
+    assert total == 3 and len(todos) == 3
+    paginas = [indice.buscar("1/2", limite=2, desde=desde) for desde in (0, 2, 4)]
+    assert [ids for ids, _ in paginas] == [todos[:2], todos[2:], []]
+    assert all(t == 3 for _, t in paginas)
+
+
+def test_indexar_de_nuevo_reemplaza_las_palabras(indice):
+    indice.indexar(5, "Manguera jardín", "rollo")
+    assert indice.buscar("tubo") == ([], 0)
+    assert indice.buscar("manguera")[0] == [5]
+    assert indice.producto(5) == ("Manguera jardín", "rollo")
+    assert len(indice) == 7
+
+
+def test_quitar(indice):
+    indice.quitar(6)
+    assert indice.buscar("luz") == ([], 0)
+    assert len(indice) == 6
+    # Las palabras que quedaron sin productos salen también del vocabulario
+    assert indice.buscar("pane") == ([], 0)
+    indice.quitar(6)
+
+
+def test_consulta_vacia_o_solo_palabras_vacias(indice):
+    assert indice.buscar("") == ([], 0)
+    assert indice.buscar("de la") == ([], 0)
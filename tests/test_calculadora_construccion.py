@@ -0,0 +1,111 @@
+import math
+
+import pytest
+
+from calculadora_construccion import calcular_materiales, leer_medidas, normalizar
+
+
+def medidas(mensaje):
+    calculo = calcular_materiales(mensaje)
+    return calculo and (calculo["area_m2"], calculo["espesor_m"], round(calculo["volumen_m3"], 4))
+
+
+@pytest.mark.parametrize("mensaje, esperado", [
+    ("radier 5x4x0.15", (20.0, 0.15, 3.0)),
+    ("radier 5 x 4 x 15 cm", (20.0, 0.15, 3.0)),
+    ("radier 5x4 espesor 0.15 m", (20.0, 0.15, 3.0)),
+    ("radier 5 x 4 m de 0.15 m de espesor", (20.0, 0.15, 3.0)),
+    ("radier 5 x 4 metros por 15 cm", (20.0, 0.15, 3.0)),
+    ("radier de 20 m2 de 12 cm", (20.0, 0.12, 2.4)),
+    ("radier 2,5 x 4 metros 8 cm", (10.0, 0.08, 0.8)),
+    ("radier 500cm x 400cm 10cm", (20.0, 0.1, 2.0)),
+    ("radier 20 metros cuadrados", (20.0, 0.1, 2.0)),
+    ("mortero 1:3 para 10 m2", (10.0, 0.02, 0.2)),
+    ("hormigón 3 m³", (None, None, 3.0)),
+])
+def test_lee_medidas(mensaje, esperado):
+    assert medidas(mensaje) == esperado
+
+
+@pytest.mark.parametrize("mensaje", [
+    "mortero 1 por 3",              # proporción, no 3 m²
+    "hacer mezcla 1 x 4",
+    "mortero 1:3",
+    "radier 5x4x10",                # 10 cm o 10 m
+    "radier 5 por 4 espesor 10",
+    "radier 5x4 y 3x2",             # dos superficies
+    "radier 5x4 10cm y 15cm",       # dos espesores
+    "radier 5x4x2 m",               # espesor imposible
+    "radier 10 x 10 cm",            # 10 m por 10 cm o 10 cm por lado
+    "radier 20 cm x 5",
+    "radier 5 x 0.2",               # lado demasiado corto
+    "cuanto cemento necesito",
+])
+def test_ambiguo_lo_responde_el_modelo(mensaje):
+    assert calcular_materiales(mensaje) is None
+
+
+def test_tres_medidas_calcula_sacos():
+    calculo = calcular_materiales("radier 5x4x0.15")
+    assert calculo["volumen_m3"] == pytest.approx(3.0)
+    assert calculo["cemento_sacos"] == 38
+
+
+def test_espesor_por_defecto_segun_trabajo():
+    assert calcular_materiales("radier 5x4")["espesor_m"] == 0.10
+    assert calcular_materiales("mortero 10 m2")["espesor_m"] == 0.02
+
+
+def test_proporcion_no_tapa_la_superficie():
+    assert leer_medidas(normalizar("mezcla 1:2:3 para 5x4")) == (20.0, None, None)
+
+
+@pytest.fixture
+def catalogo(monkeypatch):
+    import buscador
+    import calculadora_construccion
+
+    indice = buscador.IndiceProductos()
+    for id_producto, nombre, medida in [
+        (1, "Cemento de contacto", "1/4 gl"),
+        (2, "Cemento Sherwin 1/2", "unidad"),
+        (3, "Saco de cemento Polpaico 25kg", "unidad"),
+        (4, "Arena gruesa", "m3"),
+        (5, "Ripio saco 25 kg", "saco"),
+    ]:
+        indice.indexar(id_producto, nombre, medida)
+    monkeypatch.setattr(buscador, "obtener_indice", lambda: indice)
+    monkeypatch.setattr(calculadora_construccion, "PRODUCTOS_CALCULO", {"cemento": None, "arena": None, "ripio": None})
+    return calculadora_construccion
+
+
+def test_presentacion():
+    from calculadora_construccion import presentacion
+
+    assert presentacion("cemento", "Saco de cemento Polpaico 25kg", "unidad") == ("kg", 25.0)
+    assert presentacion("cemento", "Cemento de contacto", "1/4 gl") is None
+    assert presentacion("cemento", "Cemento de contacto 1 kg", "tarro") is None
+    assert presentacion("arena", "Arena gruesa", "m3") == ("m3", 1.0)
+    assert presentacion("ripio", "Ripio", "unidad") is None
+
+
+def test_sugiere_productos_con_presentacion_conocida(catalogo):
+    calculo = catalogo.calcular_materiales("radier 5x4x0.15")
+    sugeridos = {id_producto: cantidad for id_producto, _, _, cantidad in catalogo.productos_para_calculo(calculo)}
+    # 945 kg de cemento en sacos de 25 kg, arena por m³ y ripio en sacos de 25 kg a 1500 kg/m³
+    assert sugeridos == {3: 38, 4: 2, 5: math.ceil(2.65 * 1500 / 25)}
+
+
+def test_producto_configurado(catalogo, monkeypatch):
+    catalogo.buscador.obtener_indice().indexar(6, "Cemento Melón 42,5 kg", "saco")
+    monkeypatch.setitem(catalogo.PRODUCTOS_CALCULO, "cemento", 6)
+    calculo = catalogo.calcular_materiales("radier 5x4x0.15")
+    sugeridos = {id_producto: cantidad for id_producto, _, _, cantidad in catalogo.productos_para_calculo(calculo)}
+    assert sugeridos[6] == 23
+
+
+def test_producto_configurado_sin_presentacion_no_se_sugiere(catalogo, monkeypatch):
+    monkeypatch.setitem(catalogo.PRODUCTOS_CALCULO, "cemento", 2)
+    calculo = catalogo.calcular_materiales("radier 5x4x0.15")
+    ids = [s[0] for s in catalogo.productos_para_calculo(calculo)]
+    assert 2 not in ids and 3 not in ids
@@ -0,0 +1,33 @@
+from carrito import LIMITE_MENSAJE, formatear_carrito, largo_mensaje, pesos
+
+
+def test_largo_cuenta_unidades_utf16():
+    assert largo_mensaje("abc") == 3
+    assert largo_mensaje("🛒") == 2
+
+
+def test_pesos_con_punto_de_miles():
+    assert pesos(1234567) == "$1.234.567"
+
+
+def test_carrito_corto_en_un_mensaje():
+    mensajes = formatear_carrito([("Cemento", 2, 10000)], 10000)
+    assert len(mensajes) == 1
+    assert "(1/1)" not in mensajes[0]
+    assert mensajes[0].endswith("💰 *Total:* $10.000")
+
+
+def test_carrito_largo_se_divide_bajo_el_limite():
+    lineas = [(f"Producto 🔩 {i}", i, 1000 * i) for i in range(1, 201)]
+    total = sum(subtotal for _, _, subtotal in lineas)
+    mensajes = formatear_carrito(lineas, total)
+
+    assert len(mensajes) > 1
+    assert all(largo_mensaje(m) <= LIMITE_MENSAJE for m in mensajes)
+    # Cada línea aparece una sola vez
+    assert sum(m.count("🔹") for m in mensajes) == len(lineas)
+    for i, mensaje in enumerate(mensajes, 1):
+        assert f"({i}/{len(mensajes)})" in mensaje
+    # El total solo va en el último
+    assert [("Total:" in m) for m in mensajes] == [False] * (len(mensajes) - 1) + [True]
+    assert mensajes[-1].endswith(pesos(total))
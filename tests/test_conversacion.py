@@ -0,0 +1,46 @@
+import pytest
+
+from conversacion import MaquinaEstados, Respuesta, TransicionInvalida
+
+
+class TurnoFalso:
+    def __init__(self, estado):
+        self.estado = estado
+
+
+@pytest.fixture
+def maquina():
+    maquina = MaquinaEstados(inicial="menu")
+
+    @maquina.estado("menu", transiciones=["buscando"])
+    def menu(turno, mensaje, respuesta):
+        turno.estado = mensaje
+        respuesta.message(f"menu -> {mensaje}")
+
+    @maquina.estado("buscando")
+    def buscando(turno, mensaje, respuesta):
+        turno.estado = mensaje
+
+    return maquina
+
+
+def test_transicion_declarada(maquina):
+    turno, respuesta = TurnoFalso("menu"), Respuesta()
+    assert maquina.atender(turno, "buscando", respuesta) == "menu"
+    assert turno.estado == "buscando"
+    assert respuesta.mensajes == ["menu -> buscando"]
+
+
+def test_quedarse_en_el_mismo_estado(maquina):
+    turno = TurnoFalso("buscando")
+    maquina.atender(turno, "buscando", Respuesta())
+    assert turno.estado == "buscando"
+
+
+def test_transicion_no_declarada(maquina):
+    with pytest.raises(TransicionInvalida):
+        maquina.atender(TurnoFalso("buscando"), "menu", Respuesta())
+
+
+def test_estado_desconocido_usa_el_inicial(maquina):
+    assert maquina.atender(TurnoFalso("finalizado"), "buscando", Respuesta()) == "menu"
@@ -0,0 +1,49 @@
+import pytest
+
+import db
+from datos import Turno
+from sesiones import AlmacenMemoria, Sesion
+
+
+@pytest.fixture
+def almacen():
+    return AlmacenMemoria(automatico=False)
+
+
+def test_recordar_no_pisa_una_transicion_sin_volcar(almacen):
+    almacen.modificar(1, Sesion(10, "esperando_cantidad", "55", id_carrito=7))
+    # Un turno leyó la tabla antes del volcado: trae el estado anterior
+    almacen.recordar(1, Sesion(10, "buscando_producto", None, id_carrito=8))
+    sesion = almacen.obtener(1)
+    assert (sesion.estado, sesion.dato_temp, sesion.id_carrito) == ("esperando_cantidad", "55", 8)
+    assert almacen.metricas()["pendientes"] == 1
+
+
+def test_recordar_reemplaza_una_sesion_nueva(almacen):
+    almacen.modificar(1, Sesion(10, "esperando_cantidad", "55"))
+    almacen.recordar(1, Sesion(11, "menu", None))
+    sesion = almacen.obtener(1)
+    assert (sesion.id_sesion, sesion.estado) == (11, "menu")
+    assert almacen.metricas()["pendientes"] == 0
+
+
+def test_volcar_reencola_si_falla(almacen, monkeypatch):
+    def sin_base():
+        raise RuntimeError("sin base")
+
+    monkeypatch.setattr(db, "cursor", sin_base)
+    almacen.modificar(1, Sesion(10, "menu", None))
+    almacen.modificar(2, Sesion(20, "buscando_producto", None))
+    with pytest.raises(Exception):
+        almacen.volcar()
+    assert almacen.metricas()["pendientes"] == 2
+    assert almacen.volcadas == 0
+
+
+def test_turno_combina_solo_la_misma_sesion():
+    turno = Turno("+56911111111")
+    turno.id_sesion, turno.estado, turno.dato_temp = 10, "menu", None
+    turno._combinar_sesion(Sesion(9, "esperando_cantidad", "55"))
+    assert (turno.estado, turno.dato_temp) == ("menu", None)
+    turno._combinar_sesion(Sesion(10, "esperando_cantidad", "55"))
+    assert (turno.estado, turno.dato_temp) == ("esperando_cantidad", "55")
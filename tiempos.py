@@ -0,0 +1,239 @@
+import bisect
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps
+
+# Límites superiores (ms) de los buckets de los histogramas; el último bucket es "+Inf"
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+SIN_ESTADO = "sin_estado"
+
+# Perfilador por muestreo: toma las pilas de los hilos que están atendiendo un mensaje y
+# guarda las de los webhooks lentos. Apagado por defecto; se activa con PERFILADOR=1.
+PERFILADOR = os.getenv("PERFILADOR") == "1"
+# Segundos entre muestras
+PERFILADOR_INTERVALO = float(os.getenv("PERFILADOR_INTERVALO", "0.005"))
+# Solo se guardan los mensajes que tardan al menos esto (ms)
+PERFILADOR_LENTO_MS = float(os.getenv("PERFILADOR_LENTO_MS", "1000"))
+# Cuántas capturas se conservan por worker
+PERFILADOR_CAPTURAS = int(os.getenv("PERFILADOR_CAPTURAS", "20"))
+PERFILADOR_PROFUNDIDAD = 40
+
+
+class Histograma:
+    __slots__ = ("cuentas", "n", "suma", "maximo")
+
+    def __init__(self):
+        self.cuentas = [0] * (len(BUCKETS_MS) + 1)
+        self.n = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def registrar(self, ms):
+        self.cuentas[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.n += 1
+        self.suma += ms
+        self.maximo = max(self.maximo, ms)
+
+    def percentil(self, p):
+        # Interpolado dentro del bucket donde cae; el error queda acotado por el ancho del bucket
+        objetivo = p / 100 * self.n
+        acumulado = 0
+        for i, cuenta in enumerate(self.cuentas):
+            if cuenta and acumulado + cuenta >= objetivo:
+                desde = BUCKETS_MS[i - 1] if i else 0.0
+                hasta = BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.maximo
+                return min(self.maximo, desde + (hasta - desde) * (objetivo - acumulado) / cuenta)
+            acumulado += cuenta
+        return 0.0
+
+    def resumen(self):
+        limites = [str(b) for b in BUCKETS_MS] + ["+Inf"]
+        return {
+            "n": self.n,
+            "total_ms": round(self.suma, 3),
+            "promedio_ms": round(self.suma / self.n, 3) if self.n else 0.0,
+            "p50_ms": round(self.percentil(50), 3),
+            "p95_ms": round(self.percentil(95), 3),
+            "p99_ms": round(self.percentil(99), 3),
+            "max_ms": round(self.maximo, 3),
+            "buckets": {limite: c for limite, c in zip(limites, self.cuentas) if c},
+        }
+
+
+class Peticion:
+    # Un mensaje atendido: sus tramos se registran al terminar, bajo el estado de la
+    # conversación que lo atendió (que se conoce recién a mitad del mensaje)
+    __slots__ = ("nombre", "estado", "tramos", "muestras")
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.estado = SIN_ESTADO
+        self.tramos = []
+        self.muestras = Counter()
+
+
+_histogramas = defaultdict(Histograma)   # (estado, tramo) -> Histograma
+_lock = threading.Lock()
+_peticion = contextvars.ContextVar("peticion", default=None)
+
+
+def _registrar(estado, tramos):
+    with _lock:
+        for nombre, ms in tramos:
+            _histogramas[(estado, nombre)].registrar(ms)
+
+
+@contextmanager
+def medir(nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = 1000 * (time.perf_counter() - inicio)
+        actual = _peticion.get()
+        if actual is not None:
+            actual.tramos.append((nombre, ms))
+        else:
+            _registrar(SIN_ESTADO, [(nombre, ms)])
+
+
+def medido(nombre):
+    def decorar(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with medir(nombre):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorar
+
+
+def marcar_estado(estado):
+    actual = _peticion.get()
+    if actual is not None:
+        actual.estado = estado
+
+
+@contextmanager
+def peticion(nombre):
+    # Dentro de otra petición (tareas eager en modo local) cuenta como un tramo más de esa
+    if _peticion.get() is not None:
+        with medir(nombre):
+            yield
+        return
+    actual = Peticion(nombre)
+    token = _peticion.set(actual)
+    perfilador.seguir(actual)
+    inicio = time.perf_counter()
+    try:
+        yield actual
+    finally:
+        ms = 1000 * (time.perf_counter() - inicio)
+        perfilador.soltar(actual, ms)
+        _peticion.reset(token)
+        actual.tramos.append((nombre, ms))
+        _registrar(actual.estado, actual.tramos)
+
+
+def metricas():
+    with _lock:
+        copia = {clave: h.resumen() for clave, h in _histogramas.items()}
+    por_estado = defaultdict(dict)
+    for (estado, tramo), resumen in sorted(copia.items()):
+        por_estado[estado][tramo] = resumen
+    return {"pid": os.getpid(), "estados": por_estado}
+
+
+def limpiar():
+    with _lock:
+        _histogramas.clear()
+
+
+class Perfilador:
+    def __init__(self, activo=PERFILADOR, intervalo=PERFILADOR_INTERVALO, lento_ms=PERFILADOR_LENTO_MS,
+                 capturas=PERFILADOR_CAPTURAS):
+        self.activo = activo
+        self.intervalo = intervalo
+        self.lento_ms = lento_ms
+        self.capturas = deque(maxlen=capturas)
+        self._activas = {}    # id del hilo -> Peticion en curso
+        self._lock = threading.Lock()
+        self._pid = None
+        self.muestreos = 0
+
+    def seguir(self, actual):
+        if not self.activo:
+            return
+        self._arrancar()
+        with self._lock:
+            self._activas[threading.get_ident()] = actual
+
+    def soltar(self, actual, ms):
+        # Se puede apagar a mitad de una petición (/admin/perfilador): igual se deja de seguir
+        if not self.activo and not self._activas:
+            return
+        with self._lock:
+            if self._activas.pop(threading.get_ident(), None) is None or not self.activo:
+                return
+            if ms < self.lento_ms:
+                return
+            self.capturas.append({
+                "cuando": time.time(),
+                "peticion": actual.nombre,
+                "estado": actual.estado,
+                "duracion_ms": round(ms, 3),
+                "tramos": [(nombre, round(t, 3)) for nombre, t in actual.tramos],
+                "muestras": sum(actual.muestras.values()),
+                # Pilas plegadas "archivo:función:línea;...", el formato que leen flamegraph.pl y speedscope
+                "pilas": [f"{pila} {n}" for pila, n in actual.muestras.most_common()],
+            })
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "activo": self.activo,
+                "intervalo_s": self.intervalo,
+                "lento_ms": self.lento_ms,
+                "muestreos": self.muestreos,
+                "capturas": list(self.capturas),
+            }
+
+    def _arrancar(self):
+        # Un hilo de muestreo por proceso; tras un fork se crea uno nuevo
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._activas.clear()
+                    threading.Thread(target=self._muestrear, name="perfilador", daemon=True).start()
+
+    def _muestrear(self):
+        propio = threading.get_ident()
+        while True:
+            time.sleep(self.intervalo)
+            if not self._activas:
+                continue
+            marcos = sys._current_frames()
+            with self._lock:
+                for hilo, actual in self._activas.items():
+                    marco = marcos.get(hilo)
+                    if marco is not None and hilo != propio:
+                        actual.muestras[_pila(marco)] += 1
+                self.muestreos += 1
+            del marcos
+
+
+def _pila(marco):
+    partes = []
+    while marco is not None and len(partes) < PERFILADOR_PROFUNDIDAD:
+        codigo = marco.f_code
+        partes.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}:{marco.f_lineno}")
+        marco = marco.f_back
+    return ";".join(reversed(partes))
+
+
+perfilador = Perfilador()